@@ -37,7 +37,7 @@ def build_parser() -> argparse.ArgumentParser:
     run_parser.add_argument("--max-tokens", type=int, default=2048,
                             help="Max new tokens to generate per turn (default 2048)")
     run_parser.add_argument("--stream-mode", choices=["all","final","off"], default="all",
-                            help="Streaming display: 'all' prints raw stream, 'final' prints only the <|channel|>final in real time, 'off' disables streaming")
+                            help="Streaming display: 'all' prints raw stream, 'final' prints only the Harmony <|channel|>final in real time (hf/plain chat, or auto without a Harmony renderer, stream everything), 'off' disables streaming")
     run_parser.add_argument("--stop", action="append", default=None,
                             help="Add a stop sequence (can be repeated). For Harmony, defaults to <|end|> and <|start|> when not provided.")
     run_parser.add_argument("--time-limit", type=int, default=0,
@@ -6,41 +6,39 @@
 from __future__ import annotations
 
 import os
-import json
+import sys
 
-from core import HF_CACHE_PATH, load_alias_dict, resolve_to_cache_key, alias_file_path
+from core import HF_CACHE_PATH, _ROOT_ARTIFACTS, load_alias_dict, resolve_to_cache_key, save_alias_dict
 
 
 def _list_cached_models_all() -> list[str]:
     """Return all cached HF models that either have a snapshot OR root-level artifacts (config/safetensors/bin).
     Accepts repos like models--<org>--<repo> even when cloned without snapshots.
+    Uses one scandir pass over the hub so entry types come from the directory listing instead of extra stat calls.
     """
     model_dir = HF_CACHE_PATH
     models = []
-    if os.path.isdir(model_dir):
-        for m in os.listdir(model_dir):
-            if not m.startswith("models--"):
-                continue
-            model_path = os.path.join(model_dir, m)
-            if not os.path.isdir(model_path):
-                continue
-            snaps = os.path.join(model_path, "snapshots")
+    try:
+        with os.scandir(model_dir) as it:
+            entries = [e for e in it if e.name.startswith("models--") and e.is_dir()]
+    except OSError:
+        return models
+    for entry in entries:
+        has_snap = False
+        try:
+            with os.scandir(os.path.join(entry.path, "snapshots")) as snaps:
+                has_snap = any(s.is_dir() for s in snaps)
+        except OSError:
             has_snap = False
-            if os.path.isdir(snaps):
-                try:
-                    has_snap = any(entry.is_dir() for entry in os.scandir(snaps))
-                except Exception:
-                    has_snap = False
-            if has_snap:
-                models.append(m)
-                continue
-            # No snapshots — accept if common artifacts exist at repo root
-            try:
-                files = os.listdir(model_path)
-                if any(f in files for f in ("config.json", "model.safetensors", "model.safetensors.index.json", "pytorch_model.bin", "tokenizer.json", "tokenizer.model")):
-                    models.append(m)
-            except Exception:
-                pass
+        if has_snap:
+            models.append(entry.name)
+            continue
+        # No snapshots — accept if common artifacts exist at repo root
+        try:
+            if not _ROOT_ARTIFACTS.isdisjoint(os.listdir(entry.path)):
+                models.append(entry.name)
+        except OSError:
+            pass
     return sorted(models)
 
 
@@ -55,8 +53,7 @@ def _sync_alias_from_cache() -> None:
                 alias_dict[m] = ""
                 changed = True
         if changed:
-            with open(alias_file_path, "w", encoding="utf-8") as f:
-                json.dump(alias_dict, f, indent=2)
+            save_alias_dict(alias_dict)
             print("📝 Alias file updated from cache (added new models).")
     except Exception as e:
         print(f"⚠️ Failed to sync aliases from cache: {e}")
@@ -66,23 +63,35 @@ def alias_interactive() -> None:
     """Interactive alias management with add/edit/remove support."""
     _sync_alias_from_cache()
 
+    # Rescan the hub only when its directory mtime changes (model added/removed)
+    models: list[str] = []
+    hub_mtime = None
+    # Aliases change only through this menu, which updates the dict as it writes
+    alias_dict = load_alias_dict()
     while True:  # Main loop to allow returning to menu
-        models = _list_cached_models_all()
+        try:
+            mtime = os.stat(HF_CACHE_PATH).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is None or mtime != hub_mtime:
+            models = _list_cached_models_all()
+            hub_mtime = mtime
         if not models:
             print("❗ No models found."); return
 
-        alias_dict = load_alias_dict()
-
-        print("🧠 Installed models:\n")
+        # Draw the whole menu with a single write
+        lines = ["🧠 Installed models:\n"]
         for i, m in enumerate(models, start=1):
             current_alias = alias_dict.get(m, "")
             model_display = f"{i}. {m}".ljust(70)
             if current_alias:
-                print(f"{model_display}  [{current_alias}]")
+                lines.append(f"{model_display}  [{current_alias}]")
             else:
-                print(f"{model_display}  [No alias]")
-        print("0. Exit")
-        print("\n💡 Tip: You can type /exit at any time to cancel the operation.\n")
+                lines.append(f"{model_display}  [No alias]")
+        lines.append("0. Exit")
+        lines.append("\n💡 Tip: You can type /exit at any time to cancel the operation.\n")
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
 
         selected_model = None
         while selected_model is None:
@@ -100,13 +109,13 @@ def alias_interactive() -> None:
 
         current_alias = alias_dict.get(selected_model, "")
 
+        if current_alias:
+            prompt_msg = f"Enter new alias to add or change, or leave blank to remove:\n(Current: '{current_alias}')\n> "
+        else:
+            prompt_msg = "Enter new alias to add or change, or leave blank to remove:\n(Current: [No alias])\n> "
+
         alias = ""
         while not alias:
-            if current_alias:
-                prompt_msg = f"Enter new alias to add or change, or leave blank to remove:\n(Current: '{current_alias}')\n> "
-            else:
-                prompt_msg = "Enter new alias to add or change, or leave blank to remove:\n(Current: [No alias])\n> "
-
             alias = input(prompt_msg).strip()
             if alias.lower() == "/exit":
                 print("👋 Bye!"); return
@@ -120,11 +129,11 @@ def alias_interactive() -> None:
                         break  # Return to main menu
                     alias_dict[selected_model] = ""
                     try:
-                        with open(alias_file_path, "w", encoding="utf-8") as f:
-                            json.dump(alias_dict, f, indent=2)
+                        save_alias_dict(alias_dict)
                         print(f"🧹 Removed alias '{current_alias}'\n")
                     except Exception as e:
                         print(f"❌ Failed to write alias file: {e}\n")
+                        alias_dict = load_alias_dict()
                     break  # Return to main menu
                 else:
                     print("❌ No alias to remove. Returning to menu...\n")
@@ -154,11 +163,11 @@ def alias_interactive() -> None:
 
         alias_dict[selected_model] = alias
         try:
-            with open(alias_file_path, "w", encoding="utf-8") as f:
-                json.dump(alias_dict, f, indent=2)
+            save_alias_dict(alias_dict)
             print(f"✅ Alias '{alias}' {action} successfully!\n")
         except Exception as e:
             print(f"❌ Failed to write alias file: {e}\n")
+            alias_dict = load_alias_dict()
 
         # After successful operation, return to main menu
         continue
@@ -178,9 +187,9 @@ def alias_main(argv: list[str] | None = None) -> None:
     if cmd == "list":
         if not alias_dict:
             print("(No aliases)"); return
-        print("ALIAS".ljust(24), "→", "MODEL NAME")
-        for full_name, al in alias_dict.items():
-            print(al.ljust(24), "→", full_name)
+        rows = [f"{'ALIAS'.ljust(24)} → MODEL NAME"]
+        rows.extend(f"{al.ljust(24)} → {full_name}" for full_name, al in alias_dict.items())
+        sys.stdout.write("\n".join(rows) + "\n")
         return
 
     if cmd == "add":
@@ -194,8 +203,7 @@ def alias_main(argv: list[str] | None = None) -> None:
             print(f"❌ Alias '{new_alias}' already exists."); return
         alias_dict[key] = new_alias
         try:
-            with open(alias_file_path, "w", encoding="utf-8") as f:
-                json.dump(alias_dict, f, indent=2)
+            save_alias_dict(alias_dict)
             print(f"✅ Added alias '{new_alias}' for '{key}'")
         except Exception as e:
             print(f"❌ Failed to write alias file: {e}")
@@ -218,8 +226,7 @@ def alias_main(argv: list[str] | None = None) -> None:
             print(f"❌ Alias '{new_alias}' already exists."); return
         alias_dict[found_key] = new_alias
         try:
-            with open(alias_file_path, "w", encoding="utf-8") as f:
-                json.dump(alias_dict, f, indent=2)
+            save_alias_dict(alias_dict)
             print(f"✅ Changed alias '{old_alias}' → '{new_alias}' for '{found_key}'")
         except Exception as e:
             print(f"❌ Failed to update alias file: {e}")
@@ -239,8 +246,7 @@ def alias_main(argv: list[str] | None = None) -> None:
         if not removed_key:
             print(f"❓ Alias '{target_alias}' not found."); return
         try:
-            with open(alias_file_path, "w", encoding="utf-8") as f:
-                json.dump(alias_dict, f, indent=2)
+            save_alias_dict(alias_dict)
             print(f"🧹 Removed alias '{target_alias}' (was for '{removed_key}')")
         except Exception as e:
             print(f"❌ Failed to update alias file: {e}")
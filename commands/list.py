@@ -6,10 +6,10 @@
 from __future__ import annotations
 
 import os
-import subprocess
+import sys
 from datetime import datetime
 
-from core import HF_CACHE_PATH, load_alias_dict
+from core import HF_CACHE_PATH, _ROOT_ARTIFACTS, load_alias_dict, _dir_usage, _human_bytes
 
 
 def list_models(show_all: bool = False) -> None:
@@ -31,22 +31,22 @@ def list_models(show_all: bool = False) -> None:
             if not os.path.isdir(model_path):
                 continue
             snaps = os.path.join(model_path, "snapshots")
+            has_snap = False
             if os.path.isdir(snaps):
                 try:
                     has_snap = any(entry.is_dir() for entry in os.scandir(snaps))
                 except Exception:
-                    has_snap = False
-                if has_snap:
-                    models.append(m)
+                    pass
+            if has_snap:
+                models.append(m)
+                continue
 
             # Fallback: accept repos without snapshots if they have artifacts in the repo root
-            if m not in models:
-                try:
-                    files = os.listdir(model_path)
-                    if any(f in files for f in ("config.json", "model.safetensors", "pytorch_model.bin", "model.safetensors.index.json", "tokenizer.json", "tokenizer.model")):
-                        models.append(m)
-                except Exception:
-                    pass
+            try:
+                if not _ROOT_ARTIFACTS.isdisjoint(os.listdir(model_path)):
+                    models.append(m)
+            except Exception:
+                pass
 
 
         # Output
@@ -54,25 +54,28 @@ def list_models(show_all: bool = False) -> None:
             if os.getenv("MLXLM_DEBUG") == "1":
                 print(f"[DEBUG] Scanned hub at {model_dir}; found {len(models)} model dirs (snapshots or artifacts).")
             print("🧠 Installed MLX Models:\n")
-            print("MODEL NAME".ljust(65), "ALIAS".ljust(24), "SIZE".ljust(10), "LAST MODIFIED")
+            dt_now = datetime.now()
+            rows = [" ".join(("MODEL NAME".ljust(65), "ALIAS".ljust(24), "SIZE".ljust(10), "LAST MODIFIED"))]
             for m in models:
                 model_path = os.path.join(model_dir, m)
-                file_paths = [os.path.join(root, f) for root, _, files in os.walk(model_path) for f in files]
+                # One walk yields both the size and the newest mtime; no per-file path list
                 try:
-                    size_str = subprocess.check_output(['du', '-sh', model_path]).decode().split()[0]
+                    size, newest = _dir_usage(model_path)
+                    size_str = _human_bytes(size)
                 except Exception:
-                    size_str = "N/A"
+                    size_str = "N/A"; newest = 0.0
                 try:
-                    mod_time = max(os.path.getmtime(fp) for fp in file_paths) if file_paths else os.path.getmtime(model_path)
-                    dt_now = datetime.now(); dt_mod = datetime.fromtimestamp(mod_time)
-                    delta = dt_now - dt_mod
+                    mod_time = newest or os.path.getmtime(model_path)
+                    delta = dt_now - datetime.fromtimestamp(mod_time)
                     if delta.days == 0:   mod_str = "Today"
                     elif delta.days == 1: mod_str = "Yesterday"
                     else:                 mod_str = f"{delta.days} days ago"
                 except Exception:
                     mod_str = "N/A"
                 alias = alias_dict.get(m, "")
-                print(m.ljust(65), alias.ljust(24), size_str.ljust(10), mod_str)
+                rows.append(" ".join((m.ljust(65), alias.ljust(24), size_str.ljust(10), mod_str)))
+            # One write for the whole table instead of a print per row
+            sys.stdout.write("\n".join(rows) + "\n")
         else:
             print("(No models installed)")
     else:
@@ -7,8 +7,6 @@ from __future__ import annotations
 
 import os
 
-from huggingface_hub import snapshot_download
-
 
 def pull_model(model_name: str) -> None:
     """
@@ -17,6 +15,9 @@ def pull_model(model_name: str) -> None:
     Args:
         model_name: Repository ID (e.g., 'google/gemma-3-27b-it')
     """
+    # Imported here, like mlx_lm in run_model, so other subcommands don't load huggingface_hub
+    from huggingface_hub import snapshot_download
+
     print(f"🔽 Downloading model '{model_name}' to local cache...")
     try:
         local_dir = snapshot_download(repo_id=model_name)
@@ -6,9 +6,9 @@
 from __future__ import annotations
 
 import os
-import json
+import sys
 
-from core import HF_CACHE_PATH, load_alias_dict, resolve_to_cache_key, alias_file_path
+from core import HF_CACHE_PATH, load_alias_dict, resolve_to_cache_key, save_alias_dict
 
 
 def remove_models(targets: list[str], assume_yes: bool = False, dry_run: bool = False) -> None:
@@ -22,19 +22,14 @@ def remove_models(targets: list[str], assume_yes: bool = False, dry_run: bool =
     """
     hub_root = HF_CACHE_PATH
     alias_dict = load_alias_dict()
-    cache_keys=[]
-    for t in targets:
-        key = resolve_to_cache_key(t, alias_dict)
-        if key not in cache_keys: cache_keys.append(key)
+    cache_keys=list(dict.fromkeys(resolve_to_cache_key(t, alias_dict) for t in targets))
     plans=[]
     for key in cache_keys:
         path=os.path.join(hub_root,key)
         exists=os.path.isdir(path)
         plans.append((key,path,exists))
-    print("🗑️  Removal plan:\n")
-    for key, path, exists in plans:
-        status="FOUND" if exists else "MISSING"
-        print(f" - {key} -> {path} [{status}]")
+    rows=[f" - {key} -> {path} [{'FOUND' if exists else 'MISSING'}]" for key, path, exists in plans]
+    sys.stdout.write("🗑️  Removal plan:\n\n" + "\n".join(rows) + "\n")
     if dry_run:
         print("\n✅ Dry-run: no changes were made."); return
     if not assume_yes:
@@ -51,14 +46,14 @@ def remove_models(targets: list[str], assume_yes: bool = False, dry_run: bool =
             print(f"⚠️  Failed to delete {path}: {e}")
     if removed:
         alias_changed=False
-        for full_name in list(alias_dict.keys()):
-            if full_name in removed:
-                alias_changed=True
-                alias = alias_dict.pop(full_name, None)
-                if alias: print(f"🧹 Removed alias '{alias}' for '{full_name}'.")
+        for full_name in removed:
+            alias = alias_dict.pop(full_name, None)
+            if alias is None: continue
+            alias_changed=True
+            if alias: print(f"🧹 Removed alias '{alias}' for '{full_name}'.")
         if alias_changed:
             try:
-                with open(alias_file_path,"w") as f: json.dump(alias_dict,f,indent=2)
+                save_alias_dict(alias_dict)
                 print("📝 Alias file updated.")
             except Exception as e:
                 print(f"⚠️  Failed to update alias file: {e}")
@@ -5,10 +5,13 @@
 
 from __future__ import annotations
 
+import io
+import inspect
 import os
+import re
+import sys
 import time
-
-from mlx_lm import load, generate, stream_generate
+from collections import Counter
 
 from core import (
     load_alias_dict,
@@ -18,10 +21,71 @@ from core import (
     _render_prompt,
     _human_bytes,
     _count_tokens,
+    _count_suffix_tokens,
     _estimate_kv_bytes,
     _stream_final_from_harmony,
 )
 
+# Harmony end markers: default stop sequences, and always honoured by the
+# marker-based break when stream_generate() does not accept `stop=`.
+_HARMONY_MARKERS = ("<|end|>", "<|start|>")
+
+
+def _compile_stop_matcher(stop_seqs: list[str]) -> tuple[re.Pattern, int]:
+    """
+    Build a single matcher for a set of stop sequences.
+
+    Args:
+        stop_seqs: Stop sequences to detect in streamed output
+
+    Returns:
+        Tuple of (compiled alternation pattern, number of trailing chars to
+        carry between tokens so a sequence split across tokens is still found)
+    """
+    seqs = sorted(set(stop_seqs), key=len, reverse=True)
+    pattern = re.compile("|".join(re.escape(q) for q in seqs))
+    return pattern, len(seqs[0]) - 1
+
+
+class _StdoutBatcher:
+    """Collect streamed chunks and write them to stdout in batches.
+
+    Tokens are often only a few characters long, so writing and flushing each
+    one separately makes stdout syscalls dominate. Pending text is written on
+    newlines, every `flush_every` chunks, or on an explicit flush().
+    """
+
+    def __init__(self, flush_every: int = 8) -> None:
+        self._chunks: list[str] = []
+        self._flush_every = flush_every
+
+    def write(self, text: str) -> None:
+        self._chunks.append(text)
+        if len(self._chunks) >= self._flush_every or "\n" in text:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._chunks:
+            sys.stdout.write("".join(self._chunks))
+            self._chunks.clear()
+        sys.stdout.flush()
+
+
+def _accepts_stop(fn: callable) -> bool:
+    """
+    Check whether a generation function declares a `stop` keyword argument.
+
+    Args:
+        fn: mlx-lm generation function (generate / stream_generate)
+
+    Returns:
+        True if `stop` is an explicit parameter, False otherwise
+    """
+    try:
+        return "stop" in inspect.signature(fn).parameters
+    except (TypeError, ValueError):
+        return False
+
 
 def run_model(
     model_name: str,
@@ -48,6 +112,9 @@ def run_model(
         time_limit: Hard time limit per turn in seconds (0=off)
         history_mode: Conversation history mode ('on'=full context, 'off'=Q&A only)
     """
+    # Imported here so list/show/alias/--help don't load mlx_lm (and MLX) at startup
+    from mlx_lm import load, generate, stream_generate
+
     print(f"🚀 Loading model {model_name}...")
     try:
         model, tokenizer = load(model_name)
@@ -56,6 +123,7 @@ def run_model(
     print("✅ Model loaded. Enter your prompts! Type '/exit' or '/bye' to quit.\n")
 
     history: list[tuple[str,str]] = []
+    prev_prompt, prev_prompt_tok = "", 0
     sys_prompt = _apply_reasoning_to_system(system_prompt, reasoning)
     remember_assistant = (history_mode == "on") or (os.getenv("MLXLM_REMEMBER_ASSISTANT") == "1")
     if os.getenv("MLXLM_DEBUG") == "1":
@@ -63,6 +131,70 @@ def run_model(
         if not remember_assistant:
             print("[DEBUG] Assistant responses will NOT be stored in history (Q&A mode).")
 
+    # `final` extracts the Harmony final channel; hf/plain output has no channels
+    # to filter, so stream it directly instead of buffering it in the extractor.
+    if stream_mode == "final" and chat_mode in ("hf", "plain"):
+        if os.getenv("MLXLM_DEBUG") == "1":
+            print(f"[DEBUG] stream_mode=final only applies to Harmony; streaming all output for chat_mode={chat_mode}")
+        stream_mode = "all"
+
+    # Per-session invariants: model shape for the KV estimate and stop sequences
+    layers = hidden = 0
+    try:
+        dtype_bytes = int(os.getenv("MLXLM_KV_BYTES","2"))
+    except ValueError:
+        dtype_bytes = 2
+    if dtype_bytes not in (1,2,4): dtype_bytes=2
+    try:
+        alias_dict_cfg = load_alias_dict()
+        cache_key = resolve_to_cache_key(model_name, alias_dict_cfg)
+        cfg = load_config_for_model(cache_key) or {}
+        tc = cfg.get("text_config")
+        if isinstance(tc, dict):
+            cfg.update(tc)  # text_config overrides top-level keys
+        layers = int(cfg.get("num_hidden_layers") or cfg.get("n_layer") or cfg.get("layers") or 0)
+        hidden = int(cfg.get("hidden_size") or cfg.get("n_embd") or 0)
+    except Exception as _e:
+        if os.getenv("MLXLM_DEBUG") == "1":
+            print(f"[DEBUG] Model config lookup for RAM estimate failed: {_e}")
+
+    # stop sequences
+    stop_seqs = stop[:] if isinstance(stop, list) else None
+    env_stop = os.getenv("MLXLM_STOP", "").strip()
+    if env_stop:
+        extra = [s.strip() for s in env_stop.split(",") if s.strip()]
+        stop_seqs = (stop_seqs or []) + extra
+    no_default = os.getenv("MLXLM_NO_DEFAULT_STOPS", "0") == "1"
+    if (stop_seqs is None or len(stop_seqs) == 0) and chat_mode == "harmony" and not no_default:
+        stop_seqs = list(_HARMONY_MARKERS)
+    if os.getenv("MLXLM_DEBUG") == "1":
+        print(f"[DEBUG] stop sequences: {stop_seqs} (no_default={no_default})")
+
+    # Probe `stop=` support once per session instead of catching TypeError every turn
+    generate_stop_supported = _accepts_stop(generate)
+    stop_supported = _accepts_stop(stream_generate)
+    if os.getenv("MLXLM_DEBUG") == "1":
+        print(f"[DEBUG] stop= supported: generate={generate_stop_supported}, stream_generate={stop_supported}")
+
+    # Without native `stop=` support, stop sequences are matched on the stream
+    stop_re, tail_keep = None, 0
+    if not stop_supported:
+        fallback_seqs = [q for q in (stop_seqs or []) if q]
+        if chat_mode == "harmony":
+            fallback_seqs += _HARMONY_MARKERS
+        if fallback_seqs:
+            stop_re, tail_keep = _compile_stop_matcher(fallback_seqs)
+
+    def _generate(prompt):
+        if generate_stop_supported:
+            return generate(model, tokenizer, prompt, max_tokens=max_tokens, stop=stop_seqs)
+        return generate(model, tokenizer, prompt, max_tokens=max_tokens)
+
+    def _stream(prompt):
+        if stop_supported:
+            return stream_generate(model, tokenizer, prompt, max_tokens=max_tokens, stop=stop_seqs)
+        return stream_generate(model, tokenizer, prompt, max_tokens=max_tokens)
+
     while True:
         try:
             user_input = input("📝 Prompt: ").strip()
@@ -80,26 +212,30 @@ def run_model(
             print(f"⚠️  Prompt rendering error ({chat_mode}): {e}")
             full_prompt = f"{system_prompt}\n\nUser: {user_input}\nAssistant:"
 
+        # `auto` only renders Harmony when a Harmony renderer is installed;
+        # otherwise there is no final channel to extract this turn.
+        turn_stream = stream_mode
+        if stream_mode == "final" and chat_mode == "auto" and "<|start|>" not in full_prompt:
+            turn_stream = "all"
+
         if os.getenv("MLXLM_DEBUG") == "1":
-            u_cnt = sum(1 for r,_ in history if r=="user")
-            a_cnt = sum(1 for r,_ in history if r=="assistant")
-            print(f"[DEBUG] chat_mode={chat_mode} stream_mode={stream_mode} history(user={u_cnt}, assistant={a_cnt})")
+            role_counts = Counter(r for r,_ in history)
+            u_cnt, a_cnt = role_counts["user"], role_counts["assistant"]
+            print(f"[DEBUG] chat_mode={chat_mode} stream_mode={turn_stream} history(user={u_cnt}, assistant={a_cnt})")
             print(f"[DEBUG] rendered_prompt_chars={len(full_prompt)}")
 
         # RAM estimate（KV）
         try:
-            alias_dict_cfg = load_alias_dict()
-            cache_key = resolve_to_cache_key(model_name, alias_dict_cfg)
-            cfg = load_config_for_model(cache_key) or {}
-            if isinstance(cfg.get("text_config"), dict):
-                cfg = {**cfg, **cfg["text_config"]}
-            layers = cfg.get("num_hidden_layers") or cfg.get("n_layer") or cfg.get("layers") or 0
-            hidden = cfg.get("hidden_size") or cfg.get("n_embd") or 0
-            prompt_tok = _count_tokens(tokenizer, full_prompt)
+            # Chat templates usually only append to the previous prompt, so
+            # tokenize just the new suffix (without a second BOS) instead of
+            # the whole conversation.
+            if prev_prompt and full_prompt.startswith(prev_prompt):
+                prompt_tok = prev_prompt_tok + _count_suffix_tokens(tokenizer, full_prompt[len(prev_prompt):])
+            else:
+                prompt_tok = _count_tokens(tokenizer, full_prompt)
+            prev_prompt, prev_prompt_tok = full_prompt, prompt_tok
             ctx_tok = prompt_tok + int(max_tokens)
-            dtype_bytes = int(os.getenv("MLXLM_KV_BYTES","2"))
-            if dtype_bytes not in (1,2,4): dtype_bytes=2
-            est_bytes = _estimate_kv_bytes(int(layers or 0), int(hidden or 0), int(ctx_tok), dtype_bytes=dtype_bytes)
+            est_bytes = _estimate_kv_bytes(layers, hidden, int(ctx_tok), dtype_bytes=dtype_bytes)
             print(
                 f"\n🧮 Context tokens: prompt≈{prompt_tok}, new≤{max_tokens}, total≤{ctx_tok}\n"
                 f"🧠 KV cache est.: {_human_bytes(est_bytes)} (layers={layers or 'unknown'}, hidden={hidden or 'unknown'}, dtype={dtype_bytes*8}-bit)\n"
@@ -108,120 +244,55 @@ def run_model(
             if os.getenv("MLXLM_DEBUG") == "1":
                 print(f"[DEBUG] RAM estimate failed: {_e}")
 
-        # stop sequences
-        stop_seqs = stop[:] if isinstance(stop, list) else None
-        env_stop = os.getenv("MLXLM_STOP", "").strip()
-        if env_stop:
-            extra = [s.strip() for s in env_stop.split(",") if s.strip()]
-            stop_seqs = (stop_seqs or []) + extra
-        no_default = os.getenv("MLXLM_NO_DEFAULT_STOPS", "0") == "1"
-        if (stop_seqs is None or len(stop_seqs) == 0) and chat_mode == "harmony" and not no_default:
-            stop_seqs = ["<|end|>", "<|start|>"]
-        if os.getenv("MLXLM_DEBUG") == "1":
-            print(f"[DEBUG] stop sequences: {stop_seqs} (no_default={no_default})")
-
         # generate
+        # The Harmony extractor already coalesces tokens into chunks of a few
+        # hundred characters, so only per-token `all` output is batched.
+        out = _StdoutBatcher(flush_every=1 if turn_stream == "final" else 8)
         try:
-            print("\n🧠 Output:\n", end="", flush=True)
-            start_ts = time.time()
-
-            # Helper: try call with stop; if TypeError (unexpected 'stop'), retry without it
-            def _call_generate_with_stop(prompt):
-                try:
-                    return generate(model, tokenizer, prompt, max_tokens=max_tokens, stop=stop_seqs)
-                except TypeError as te:
-                    if "unexpected keyword argument 'stop'" in str(te):
-                        if os.getenv("MLXLM_DEBUG") == "1":
-                            print("[DEBUG] generate(): 'stop' not supported by this mlx-lm version → retrying without stop")
-                        return generate(model, tokenizer, prompt, max_tokens=max_tokens)
-                    raise
-
-            def _iter_stream_with_stop(prompt):
-                try:
-                    return stream_generate(model, tokenizer, prompt, max_tokens=max_tokens, stop=stop_seqs)
-                except TypeError as te:
-                    if "unexpected keyword argument 'stop'" in str(te):
-                        if os.getenv("MLXLM_DEBUG") == "1":
-                            print("[DEBUG] stream_generate(): 'stop' not supported → retrying without stop")
-                        return stream_generate(model, tokenizer, prompt, max_tokens=max_tokens)
-                    raise
-
-            if stream_mode == "off":
-                output = _call_generate_with_stop(full_prompt)
-                print(output, end="\n", flush=True)
-                if remember_assistant:
-                    history.append(("assistant", output))
-
-            elif stream_mode == "final":
-                # Stream only the <|channel|>final content in real time
-                _buf = [] if remember_assistant else None
-                try:
-                    token_iter_resp = stream_generate(
-                        model, tokenizer, full_prompt, max_tokens=max_tokens, stop=stop_seqs
-                    )
-                    token_iter = (resp.text for resp in token_iter_resp)
+            try:
+                print("\n🧠 Output:\n", end="", flush=True)
+                # Monotonic clock; per-token `all` output samples it every 8 tokens
+                start_ns = time.monotonic_ns()
+                limit_ns = time_limit * 1_000_000_000 if time_limit > 0 else 0
+
+                if turn_stream == "off":
+                    output = _generate(full_prompt)
+                    print(output, end="\n", flush=True)
+                    if remember_assistant:
+                        history.append(("assistant", output))
+
+                elif turn_stream == "final":
+                    # Stream only the <|channel|>final content in real time
+                    _buf = io.StringIO() if remember_assistant else None
+                    token_iter = (resp.text for resp in _stream(full_prompt))
                     for chunk in _stream_final_from_harmony(token_iter):
-                        if _buf is not None: _buf.append(chunk)
-                        print(chunk, end="", flush=True)
-                        if time_limit>0 and (time.time()-start_ts)>time_limit:
-                            print("\n⏱️ Time limit reached, stopping.\n", flush=True); break
-                except TypeError as te:
-                    if "unexpected keyword argument 'stop'" in str(te):
-                        if os.getenv("MLXLM_DEBUG") == "1":
-                            print("[DEBUG] final-stream: 'stop' failed during iteration → retrying without stop")
-                        token_iter_resp = stream_generate(
-                            model, tokenizer, full_prompt, max_tokens=max_tokens
-                        )
-                        token_iter = (resp.text for resp in token_iter_resp)
-                        for chunk in _stream_final_from_harmony(token_iter):
-                            if _buf is not None: _buf.append(chunk)
-                            print(chunk, end="", flush=True)
-                            if time_limit>0 and (time.time()-start_ts)>time_limit:
-                                print("\n⏱️ Time limit reached, stopping.\n", flush=True); break
-                    else:
-                        raise
-                print("\n")
-                if _buf is not None: history.append(("assistant","".join(_buf)))
-
-            else:  # all
-                _buf = [] if remember_assistant else None
-                tail = ""
-                stop_supported = True
-                try:
-                    stream_it = stream_generate(model, tokenizer, full_prompt, max_tokens=max_tokens, stop=stop_seqs)
-                except TypeError as te:
-                    if "unexpected keyword argument 'stop'" in str(te):
-                        if os.getenv("MLXLM_DEBUG") == "1":
-                            print("[DEBUG] stream_generate(): 'stop' not supported → streaming without stop, using marker-based break for Harmony")
-                        stop_supported = False
-                        stream_it = stream_generate(model, tokenizer, full_prompt, max_tokens=max_tokens)
-                    else:
-                        raise
-                try:
-                    for resp in stream_it:
-                        if _buf is not None: _buf.append(resp.text)
-                        print(resp.text, end="", flush=True)
-                        if time_limit>0 and (time.time()-start_ts)>time_limit:
-                            print("\n⏱️ Time limit reached, stopping.\n", flush=True); break
-                        if not stop_supported and chat_mode == "harmony":
+                        if _buf is not None: _buf.write(chunk)
+                        out.write(chunk)
+                        # Each chunk spans many tokens, so check the clock every time
+                        if limit_ns and (time.monotonic_ns()-start_ns) > limit_ns:
+                            out.flush(); print("\n⏱️ Time limit reached, stopping.\n", flush=True); break
+                    out.flush()
+                    print("\n")
+                    if _buf is not None: history.append(("assistant",_buf.getvalue()))
+
+                else:  # all
+                    _buf = io.StringIO() if remember_assistant else None
+                    tail = ""
+                    for i, resp in enumerate(_stream(full_prompt)):
+                        if _buf is not None: _buf.write(resp.text)
+                        out.write(resp.text)
+                        if limit_ns and (i & 7) == 0 and (time.monotonic_ns()-start_ns) > limit_ns:
+                            out.flush(); print("\n⏱️ Time limit reached, stopping.\n", flush=True); break
+                        if stop_re is not None:
                             tail += resp.text
-                            if "<|end|>" in tail or "<|start|>" in tail:
+                            if stop_re.search(tail):
                                 break
-                            if len(tail) > 256:
-                                tail = tail[-128:]
-                except TypeError as te:
-                    if "unexpected keyword argument 'stop'" in str(te):
-                        if os.getenv("MLXLM_DEBUG") == "1":
-                            print("[DEBUG] all-stream: 'stop' failed during iteration → retrying without stop")
-                        stream_it = stream_generate(model, tokenizer, full_prompt, max_tokens=max_tokens)
-                        for resp in stream_it:
-                            if _buf is not None: _buf.append(resp.text)
-                            print(resp.text, end="", flush=True)
-                            if time_limit>0 and (time.time()-start_ts)>time_limit:
-                                print("\n⏱️ Time limit reached, stopping.\n", flush=True); break
-                    else:
-                        raise
-                print("\n")
-                if _buf is not None: history.append(("assistant","".join(_buf)))
+                            tail = tail[-tail_keep:] if tail_keep else ""
+                    out.flush()
+                    print("\n")
+                    if _buf is not None: history.append(("assistant",_buf.getvalue()))
+            finally:
+                # Also runs on Ctrl-C, so batched tokens always reach the terminal
+                out.flush()
         except Exception as e:
             print(f"\n⚠️ Error generating response: {e}\n")
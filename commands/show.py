@@ -6,9 +6,9 @@
 from __future__ import annotations
 
 import os
-import subprocess
+import sys
 
-from core import HF_CACHE_PATH, load_alias_dict, load_config_for_model
+from core import HF_CACHE_PATH, load_alias_maps, load_config_for_model, _dir_size, _human_bytes, _MISS
 
 
 def show_info(model_name: str, full: bool = False) -> None:
@@ -22,19 +22,17 @@ def show_info(model_name: str, full: bool = False) -> None:
     if "/" in model_name and not model_name.startswith("models--"):
         org, repo = model_name.split("/", 1)
         model_name = f"models--{org}--{repo}"
-    alias_dict = load_alias_dict()
-    alias_map_lower = {alias.lower(): full_name for full_name, alias in alias_dict.items()}
-    user_input = model_name.lower()
-    if user_input in alias_map_lower:
-        model_name = alias_map_lower[user_input]
+    alias_dict, alias_map_lower, _ = load_alias_maps()
+    model_name = alias_map_lower.get(model_name.lower(), model_name)
     model_path = os.path.join(HF_CACHE_PATH, model_name)
     if os.path.exists(model_path):
-        try: size_str = subprocess.check_output(['du','-sh',model_path]).decode().split()[0]
+        try: size_str = _human_bytes(_dir_size(model_path))
         except Exception: size_str="N/A"
         alias = alias_dict.get(model_name,"")
         config = load_config_for_model(model_name)
-        if isinstance(config.get("text_config"), dict):
-            config = {**config, **config["text_config"]}
+        tc = config.get("text_config")
+        if isinstance(tc, dict):
+            config.update(tc)  # text_config overrides top-level keys
         if not config:
             print("ℹ️ Could not load config.json for this model."); return
         if full:
@@ -43,20 +41,25 @@ def show_info(model_name: str, full: bool = False) -> None:
             pprint(config, indent=2, width=100, compact=False); return
         def pick(conf,*keys):
             for k in keys:
-                if k in conf: return conf[k]
+                v = conf.get(k, _MISS)
+                if v is not _MISS: return v
             return "Unknown"
         precision="N/A"; quant_cfg=config.get("quantization_config")
         if isinstance(quant_cfg,dict): precision=quant_cfg.get("dtype","N/A")
-        print("MODEL INFO\n")
-        print(f"Name{'':<19}: {model_name}")
-        print(f"Size{'':<19}: {size_str}")
-        print(f"Alias{'':<19}: {alias}")
-        print("\n[CONFIG INFO]")
-        print(f"{'Model Architecture':<22} : {pick(config,'architectures')[0] if isinstance(config.get('architectures'),list) else 'Unknown'}")
-        print(f"{'Hidden Size':<22} : {pick(config,'hidden_size','n_embd')}")
-        print(f"{'Layers':<22} : {pick(config,'num_hidden_layers','n_layer','layers')}")
-        print(f"{'Heads':<22} : {pick(config,'num_attention_heads','n_head','heads')}")
-        print(f"{'Precision':<22} : {precision}")
-        print(f"\n[PATH]".ljust(22), ":", model_path)
+        # Assemble the whole report and write it once instead of a print per line
+        lines = [
+            "MODEL INFO\n",
+            f"Name{'':<19}: {model_name}",
+            f"Size{'':<19}: {size_str}",
+            f"Alias{'':<19}: {alias}",
+            "\n[CONFIG INFO]",
+            f"{'Model Architecture':<22} : {pick(config,'architectures')[0] if isinstance(config.get('architectures'),list) else 'Unknown'}",
+            f"{'Hidden Size':<22} : {pick(config,'hidden_size','n_embd')}",
+            f"{'Layers':<22} : {pick(config,'num_hidden_layers','n_layer','layers')}",
+            f"{'Heads':<22} : {pick(config,'num_attention_heads','n_head','heads')}",
+            f"{'Precision':<22} : {precision}",
+            "\n[PATH]".ljust(22) + " : " + model_path,
+        ]
+        sys.stdout.write("\n".join(lines) + "\n")
     else:
         print("❓ Model not found")
@@ -5,38 +5,167 @@
 
 from __future__ import annotations
 
-import os, sys, json, inspect, importlib
-from pathlib import Path
+import os, re, sys, json, inspect, importlib, functools, weakref
 from importlib import resources
-from huggingface_hub import HfApi
 
 # ===== Alias/Paths =====
 HF_CACHE_PATH = os.path.expanduser("~/.cache/huggingface/hub")
+# Files that mark a hub repo cloned without snapshots/ as a usable model
+_ROOT_ARTIFACTS = frozenset((
+    "config.json", "model.safetensors", "model.safetensors.index.json",
+    "pytorch_model.bin", "tokenizer.json", "tokenizer.model",
+))
 alias_file_path = os.path.join(os.path.dirname(__file__), ".mlxlm_aliases.json")
+_MISS = object()  # sentinel for "no cached value" / "key absent" lookups
+
+_JSON_CACHE: dict[str, tuple[tuple[int, int], object]] = {}  # path -> ((mtime_ns, size), parsed)
+
+def _load_json_cached(path: str) -> object:
+    """
+    Parse a JSON file, reusing the previous result while its mtime and size are unchanged.
+
+    Args:
+        path: JSON file path
+
+    Returns:
+        Parsed JSON (shared with the cache; callers must copy before mutating)
+
+    Raises:
+        OSError, json.JSONDecodeError: Same as open() / json.load()
+    """
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    hit = _JSON_CACHE.get(path)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    with open(path, "r") as f:
+        data = json.load(f)
+    _JSON_CACHE[path] = (key, data)
+    return data
 
 def load_alias_dict() -> dict:
     try:
-        with open(alias_file_path, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError, PermissionError):
+        data = _load_json_cached(alias_file_path)
+    except (OSError, json.JSONDecodeError):
         return {}
+    # Copy so callers can edit and save without touching the cached parse
+    return dict(data) if isinstance(data, dict) else {}
+
+_ALIAS_MAPS: dict[str, tuple[object, tuple[dict, dict]]] = {}  # path -> (parse, its lookup maps)
+
+def load_alias_maps() -> tuple[dict, dict, dict]:
+    """
+    Load the alias dict together with its lowercase lookup maps.
+
+    The maps are built once per parse of the alias file and reused until
+    _JSON_CACHE re-reads it.
+
+    Returns:
+        Tuple of (alias dict copy, alias.lower() -> cache key,
+        cache key.lower() -> cache key)
+    """
+    try:
+        data = _load_json_cached(alias_file_path)
+    except (OSError, json.JSONDecodeError):
+        data = None
+    if not isinstance(data, dict):
+        return {}, {}, {}
+    hit = _ALIAS_MAPS.get(alias_file_path)
+    if hit is None or hit[0] is not data:
+        hit = _ALIAS_MAPS[alias_file_path] = (data, _build_alias_maps(data))
+    return (dict(data), *hit[1])
+
+def invalidate_alias_cache(path: str | None = None) -> None:
+    """
+    Drop the cached parse of an alias file after it is rewritten.
+
+    The parse cache is keyed on mtime/size, which can miss a same-size rewrite
+    within the filesystem's timestamp granularity; writers call this to be sure.
+    Lookup maps are tied to the parse object, so the next load rebuilds them.
+
+    Args:
+        path: Alias file path (defaults to alias_file_path)
+    """
+    _JSON_CACHE.pop(path or alias_file_path, None)
+
+def save_alias_dict(alias_dict: dict, path: str | None = None) -> bool:
+    """
+    Write the alias file atomically, skipping the write if nothing changed.
+
+    The dict is compared with the cached parse of the file (valid while the
+    file's mtime/size match), so no-op saves cost one stat. Otherwise the JSON
+    goes to a temporary file (given the target's permissions) that replaces
+    the target with os.replace, so a crash never leaves a half-written alias
+    file; the temporary file is removed if writing fails.
+
+    Args:
+        alias_dict: Dictionary mapping cache keys to aliases
+        path: Alias file path (defaults to alias_file_path)
+
+    Returns:
+        True if the file was written, False if it was already up to date
+
+    Raises:
+        OSError: If the file cannot be written
+        TypeError: If alias_dict holds values JSON cannot serialize
+    """
+    path = path or alias_file_path
+    hit = _JSON_CACHE.get(path)
+    if hit is not None and hit[1] == alias_dict:
+        try:
+            st = os.stat(path)
+            if hit[0] == (st.st_mtime_ns, st.st_size):
+                return False
+        except OSError:
+            pass
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(alias_dict, f, indent=2)
+        try:
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)  # keep the original file's permissions
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    invalidate_alias_cache(path)
+    return True
 
 # ===== Name resolution =====
-def resolve_model_name(name_or_alias: str, alias_dict: dict) -> str:
+def _build_alias_maps(alias_dict: dict) -> tuple[dict, dict]:
+    """
+    Build lowercase lookup maps for an alias dict.
+
+    Args:
+        alias_dict: Dictionary mapping cache keys to aliases
+
+    Returns:
+        Tuple of (alias.lower() -> cache key, cache key.lower() -> cache key)
+    """
+    return ({alias.lower(): full_name for full_name, alias in alias_dict.items()},
+            {full_name.lower(): full_name for full_name in alias_dict})
+
+def resolve_model_name(name_or_alias: str, alias_dict: dict, maps: tuple[dict, dict] | None = None) -> str:
     """
     Resolve a user input (alias, repo ID, or cache key) to a canonical repo ID.
 
     Args:
         name_or_alias: User input string (e.g., 'gemma3', 'google/gemma-3-27b', 'models--google--gemma-3-27b')
         alias_dict: Dictionary mapping cache keys to aliases
+        maps: Lookup maps for alias_dict from load_alias_maps(); rebuilt if omitted
 
     Returns:
         Canonical repo ID (e.g., 'google/gemma-3-27b-it')
     """
     user_input = name_or_alias.lower()
-    alias_map_lower = {alias.lower(): full_name for full_name, alias in alias_dict.items()}
-    if user_input in alias_map_lower:
-        resolved = alias_map_lower[user_input]
+    alias_map_lower, model_names_lower = maps or _build_alias_maps(alias_dict)
+    resolved = alias_map_lower.get(user_input)
+    if resolved is not None:
         if resolved.lower().startswith("models--"):
             return resolved.replace("models--", "", 1).replace("--", "/")
         return resolved
@@ -45,9 +174,9 @@ def resolve_model_name(name_or_alias: str, alias_dict: dict) -> str:
         org = f"{parts[0]}-{parts[1]}"
         repo = parts[2]
         return f"{org}/{repo}"
-    model_names_lower = {full_name.lower(): full_name for full_name in alias_dict.keys()}
-    if user_input in model_names_lower:
-        return model_names_lower[user_input]
+    resolved = model_names_lower.get(user_input)
+    if resolved is not None:
+        return resolved
     if user_input.startswith("models--"):
         return name_or_alias.replace("models--", "", 1).replace("--", "/")
     return name_or_alias
@@ -69,66 +198,108 @@ def repo_to_cache_name(repo_id: str) -> str:
         return f"models--{org}--{repo}"
     return repo_id
 
-def resolve_to_cache_key(name_or_alias: str, alias_dict: dict) -> str:
+def resolve_to_cache_key(name_or_alias: str, alias_dict: dict, maps: tuple[dict, dict] | None = None) -> str:
     """
     Resolve any user input to a cache key (models--org--repo format).
 
     Args:
         name_or_alias: User input (alias, repo ID, or cache key)
         alias_dict: Dictionary mapping cache keys to aliases
+        maps: Lookup maps for alias_dict from load_alias_maps(); rebuilt if omitted
 
     Returns:
         Cache key in models--org--repo format
     """
     user = name_or_alias.strip()
     lower = user.lower()
-    alias_map_lower = {alias.lower(): full_name for full_name, alias in alias_dict.items()}
-    if lower in alias_map_lower:
-        return alias_map_lower[lower]
+    maps = maps or _build_alias_maps(alias_dict)
+    hit = maps[0].get(lower)
+    if hit is not None:
+        return hit
     if lower.startswith("models--"):
         return user
-    repo_id = resolve_model_name(user, alias_dict)
-    return repo_to_cache_name(repo_id)
+    return repo_to_cache_name(resolve_model_name(user, alias_dict, maps))
 
 # ===== Config loader (HF / local cache) =====
+@functools.lru_cache(maxsize=1)
+def _hf_api():
+    """
+    Return a shared HfApi client so repeated lookups reuse one HTTP session.
+
+    huggingface_hub is imported here rather than at module load, so commands
+    that never reach the network don't pay for it.
+
+    Returns:
+        HfApi instance
+
+    Raises:
+        ImportError: If huggingface_hub is not installed
+    """
+    from huggingface_hub import HfApi
+    return HfApi()
+
+def _load_local_config(model_id: str) -> dict | None:
+    """
+    Load config.json from the newest local snapshot that has one.
+
+    Args:
+        model_id: Model cache key (e.g., 'models--google--gemma-3-27b')
+
+    Returns:
+        Configuration dictionary, or None if no readable local config exists
+    """
+    snap_base = os.path.join(HF_CACHE_PATH, model_id, "snapshots")
+    candidates = []
+    try:
+        with os.scandir(snap_base) as it:
+            for entry in it:
+                cfg_path = os.path.join(entry.path, "config.json")
+                if entry.is_dir() and os.path.exists(cfg_path):
+                    candidates.append((entry.stat().st_mtime_ns, cfg_path))
+    except OSError:
+        return None
+    # Newest first via a linear max; older snapshots are only tried if it fails to parse
+    while candidates:
+        best = max(candidates); candidates.remove(best)
+        try:
+            cfg = _load_json_cached(best[1])
+            return dict(cfg) if isinstance(cfg, dict) else cfg
+        except (json.JSONDecodeError, PermissionError, OSError) as e:
+            if os.getenv("MLXLM_DEBUG") == "1":
+                print(f"[DEBUG] Failed to load {best[1]}: {e}")
+    return None
+
 def load_config_for_model(model_id: str) -> dict:
     """
-    Load model config.json from HuggingFace API or local cache.
+    Load model config.json from local cache, falling back to the HuggingFace API.
+
+    The local snapshot is checked first so installed models never pay for a
+    network round-trip; the API is only asked when nothing is cached and
+    MLXLM_OFFLINE is not set.
 
     Args:
         model_id: Model cache key (e.g., 'models--google--gemma-3-27b')
 
     Returns:
-        Dictionary containing model configuration, or empty dict if not found
+        Dictionary containing model configuration (a fresh dict the caller may
+        modify), or empty dict if not found
     """
+    cfg = _load_local_config(model_id)
+    if cfg is not None:
+        return cfg
     if os.getenv("MLXLM_OFFLINE") != "1":
         try:
-            cfg = HfApi().model_info(model_id).config
+            cfg = _hf_api().model_info(model_id).config
             if isinstance(cfg, dict):
                 return cfg
-        except (ConnectionError, TimeoutError, ValueError, KeyError) as e:
+        except (ImportError, ConnectionError, TimeoutError, ValueError, KeyError) as e:
             if os.getenv("MLXLM_DEBUG") == "1":
                 print(f"[DEBUG] HF API call failed: {e}")
             pass
-    cache_root = Path(HF_CACHE_PATH)
-    model_dir = cache_root / model_id
-    snap_base = model_dir / "snapshots"
-    if not snap_base.exists():
-        return {}
-    snaps = sorted(snap_base.iterdir(), key=os.path.getmtime)
-    for snap in reversed(snaps):
-        cfg_path = snap / "config.json"
-        if cfg_path.exists():
-            try:
-                with open(cfg_path) as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, PermissionError, OSError) as e:
-                if os.getenv("MLXLM_DEBUG") == "1":
-                    print(f"[DEBUG] Failed to load {cfg_path}: {e}")
-                continue
     return {}
 
 # ===== Runtime / Harmony detection =====
+@functools.lru_cache(maxsize=1)
 def _probe_mlx_runtime() -> tuple[bool, str, str | None]:
     """
     Probe MLX runtime availability and check libmlx.dylib.
@@ -146,10 +317,14 @@ def _probe_mlx_runtime() -> tuple[bool, str, str | None]:
     except Exception as e:
         return (False, str(e), None)
 
+_MODEL_TYPES: dict[str, str | None] = {}  # cache key -> detected model_type (None = unknown)
+
 def _get_model_type(model_name: str, alias_dict: dict) -> str | None:
     """
     Extract model_type from model configuration.
 
+    Results are cached per resolved cache key for the life of the process.
+
     Args:
         model_name: Model name or alias
         alias_dict: Alias dictionary
@@ -160,20 +335,69 @@ def _get_model_type(model_name: str, alias_dict: dict) -> str | None:
     try:
         repo_id = resolve_model_name(model_name, alias_dict)
         cache_key = repo_to_cache_name(repo_id)
+        mt = _MODEL_TYPES.get(cache_key, _MISS)
+        if mt is not _MISS:
+            return mt
+        mt = None
         cfg = load_config_for_model(cache_key)
         if isinstance(cfg, dict):
-            mt = (cfg.get("model_type") or cfg.get("model_architecture") or "").strip().lower()
-            if mt:
-                return mt
-            arch = cfg.get("architectures")
-            if isinstance(arch, list) and arch:
-                return str(arch[0]).strip().lower()
-        return None
+            mt = (cfg.get("model_type") or cfg.get("model_architecture") or "").strip().lower() or None
+            if mt is None:
+                arch = cfg.get("architectures")
+                if isinstance(arch, list) and arch:
+                    mt = str(arch[0]).strip().lower()
+        _MODEL_TYPES[cache_key] = mt
+        return mt
     except (KeyError, ValueError, TypeError) as e:
         if os.getenv("MLXLM_DEBUG") == "1":
             print(f"[DEBUG] Failed to get model type for {model_name}: {e}")
         return None
 
+# Renderer registry, probed in priority order with direct getattr()
+_RENDERER_NAMES = ("render_chat","render","render_messages","format_chat","format_messages","render_chatml","to_chatml","format","chat_format")
+_RENDERER_CLASSES = ("Harmony","Renderer","HarmonyRenderer","ChatRenderer")
+_RENDERER_MODULES = tuple(f"{base}.{sub}" if sub else base
+                          for base in ("openai_harmony", "openai.harmony", "harmony")
+                          for sub in ("", "chat", "renderer", "render", "core"))
+
+def _pick_renderer(mod: any) -> callable | None:
+    """
+    Pick a chat renderer from a module.
+
+    Known function names are tried first, then known renderer classes; the
+    dir()/inspect.signature scan for other render*/format* names only runs
+    when the registry misses.
+
+    Args:
+        mod: Imported module to probe
+
+    Returns:
+        Callable renderer if found, None otherwise
+    """
+    for name in _RENDERER_NAMES:
+        fn = getattr(mod, name, None)
+        if callable(fn): return fn
+    for attr in _RENDERER_CLASSES:
+        cls = getattr(mod, attr, None)
+        if cls:
+            try:
+                inst = cls()
+                if callable(getattr(inst, "render", None)):
+                    return inst.render
+            except Exception:
+                continue
+    for name in dir(mod):
+        if name.startswith(("render","format")):
+            fn = getattr(mod, name, None)
+            if callable(fn):
+                try:
+                    sig = inspect.signature(fn)
+                    if any(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in sig.parameters.values()):
+                        return fn
+                except Exception:
+                    return fn
+    return None
+
 def _load_callable_from_path(spec: str) -> callable | None:
     """
     Load a callable (function or class method) from a module path specification.
@@ -195,12 +419,14 @@ def _load_callable_from_path(spec: str) -> callable | None:
     except Exception:
         return None
     if not attr:
+        # An explicit module keeps its own precedence: the first render*/format*
+        # callable wins before any renderer class (the registry is only for auto-detection)
         for name in dir(mod):
             if name.startswith(("render","format")):
                 fn = getattr(mod, name, None)
                 if callable(fn):
                     return fn
-        for attr_name in ("Harmony","Renderer","HarmonyRenderer","ChatRenderer"):
+        for attr_name in _RENDERER_CLASSES:
             cls = getattr(mod, attr_name, None)
             if cls:
                 try:
@@ -224,17 +450,36 @@ def _load_callable_from_path(spec: str) -> callable | None:
             return None
     return obj if callable(obj) else None
 
+_HARMONY_RENDERERS: dict[str, callable | None] = {}  # MLXLM_RENDERER value -> detected renderer (None = not found)
+
 def _detect_harmony_renderer() -> callable | None:
     """
     Detect and load Harmony chat renderer from installed packages.
 
     Checks MLXLM_RENDERER environment variable first, then searches for
-    openai-harmony, openai.harmony, or harmony packages.
+    openai-harmony, openai.harmony, or harmony packages. The result (including
+    "not found") is cached per MLXLM_RENDERER value, so the module scan runs
+    once per process instead of on every prompt render.
 
     Returns:
         Callable renderer function if found, None otherwise
     """
     env_spec = os.getenv("MLXLM_RENDERER", "").strip()
+    fn = _HARMONY_RENDERERS.get(env_spec, _MISS)
+    if fn is _MISS:
+        fn = _HARMONY_RENDERERS[env_spec] = _find_harmony_renderer(env_spec)
+    return fn
+
+def _find_harmony_renderer(env_spec: str) -> callable | None:
+    """
+    Uncached Harmony renderer lookup used by _detect_harmony_renderer.
+
+    Args:
+        env_spec: Stripped MLXLM_RENDERER value ('' if unset)
+
+    Returns:
+        Callable renderer function if found, None otherwise
+    """
     if env_spec:
         fn = _load_callable_from_path(env_spec)
         if fn:
@@ -243,44 +488,14 @@ def _detect_harmony_renderer() -> callable | None:
             return fn
         else:
             print(f"⚠️  MLXLM_RENDERER set to '{env_spec}' but callable not found.")
-    explicit_names = ("render_chat","render","render_messages","format_chat","format_messages","render_chatml","to_chatml","format","chat_format")
-    submods = ("", "chat", "renderer", "render", "core")
-    bases = ("openai_harmony", "openai.harmony", "harmony")
-    def _pick_renderer(mod):
-        for name in explicit_names:
-            fn = getattr(mod, name, None)
-            if callable(fn): return fn
-        for name in dir(mod):
-            if name.startswith(("render","format")):
-                fn = getattr(mod, name, None)
-                if callable(fn):
-                    try:
-                        sig = inspect.signature(fn)
-                        if any(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in sig.parameters.values()):
-                            return fn
-                    except Exception:
-                        return fn
-        for attr in ("Harmony","Renderer","HarmonyRenderer","ChatRenderer"):
-            cls = getattr(mod, attr, None)
-            if cls:
-                try:
-                    inst = cls()
-                    if callable(getattr(inst, "render", None)):
-                        return inst.render
-                except Exception:
-                    continue
-        return None
-    import importlib as _il
-    for base in bases:
-        for sub in submods:
-            mod_name = f"{base}.{sub}" if sub else base
-            try:
-                mod = _il.import_module(mod_name)
-            except Exception:
-                continue
-            fn = _pick_renderer(mod)
-            if callable(fn):
-                return fn
+    for mod_name in _RENDERER_MODULES:
+        try:
+            mod = importlib.import_module(mod_name)
+        except Exception:
+            continue
+        fn = _pick_renderer(mod)
+        if callable(fn):
+            return fn
     return None
 
 def _preflight_and_maybe_adjust_chat(chat_mode: str, model_name: str, alias_dict: dict) -> str:
@@ -354,6 +569,26 @@ def _render_plain(system_prompt: str, history: list[tuple[str, str]]) -> str:
             last_user = content; break
     return f"{system_prompt}\n\nUser: {last_user}\nAssistant:"
 
+_TOK_HAS_TEMPLATE = weakref.WeakKeyDictionary()  # tokenizer -> has apply_chat_template
+
+def _has_chat_template(tokenizer: any) -> bool:
+    """
+    Check (once per tokenizer object) whether it provides apply_chat_template.
+
+    Args:
+        tokenizer: Model tokenizer
+
+    Returns:
+        True if the tokenizer has an apply_chat_template method
+    """
+    try:
+        return _TOK_HAS_TEMPLATE[tokenizer]
+    except KeyError:
+        cap = _TOK_HAS_TEMPLATE[tokenizer] = hasattr(tokenizer, "apply_chat_template")
+        return cap
+    except TypeError:  # not weak-referenceable / hashable: probe every time
+        return hasattr(tokenizer, "apply_chat_template")
+
 def _render_hf_template(tokenizer: any, messages: list[dict]) -> str | None:
     """
     Render messages using HuggingFace chat_template.
@@ -365,12 +600,12 @@ def _render_hf_template(tokenizer: any, messages: list[dict]) -> str | None:
     Returns:
         Rendered prompt string, or None if template not available
     """
+    if not _has_chat_template(tokenizer):
+        return None
     try:
-        if hasattr(tokenizer, "apply_chat_template"):
-            return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
     except Exception:
-        pass
-    return None
+        return None
 
 def _compose_messages(system_prompt: str, history: list[tuple[str, str]]) -> list[dict]:
     """
@@ -400,13 +635,8 @@ def render_harmony_simple(messages: list[dict]) -> str:
     Returns:
         Harmony-formatted prompt string
     """
-    parts=[]
-    for m in messages:
-        role=m.get("role","user")
-        content=m.get("content","")
-        parts.append(f"<|start|>{role}<|message|>{content}<|end|>")
-    parts.append("<|start|>assistant")
-    return "\n".join(parts)
+    body = "\n".join(f"<|start|>{m.get('role','user')}<|message|>{m.get('content','')}<|end|>" for m in messages)
+    return f"{body}\n<|start|>assistant" if body else "<|start|>assistant"
 
 def _render_prompt(chat_mode: str, tokenizer: any, system_prompt: str, history: list[tuple[str, str]]) -> str:
     """
@@ -421,9 +651,9 @@ def _render_prompt(chat_mode: str, tokenizer: any, system_prompt: str, history:
     Returns:
         Rendered prompt string ready for model input
     """
-    messages = _compose_messages(system_prompt, history)
     if chat_mode == "plain":
         return _render_plain(system_prompt, history)
+    messages = _compose_messages(system_prompt, history)
     if chat_mode == "harmony":
         renderer = _detect_harmony_renderer()
         if not renderer:
@@ -446,6 +676,8 @@ def _render_prompt(chat_mode: str, tokenizer: any, system_prompt: str, history:
     return _render_plain(system_prompt, history)
 
 # ===== Token / memory helpers =====
+_BYTE_UNITS = ("B","KB","MB","GB","TB","PB")
+
 def _human_bytes(n: int) -> str:
     """
     Convert byte count to human-readable format.
@@ -456,16 +688,67 @@ def _human_bytes(n: int) -> str:
     Returns:
         Formatted string (e.g., '1.5 GB', '512.00 MB')
     """
-    units=["B","KB","MB","GB","TB"]; s=float(n)
-    for u in units:
-        if s<1024.0: return f"{s:.2f} {u}"
-        s/=1024.0
-    return f"{s:.2f} PB"
+    # Unit index straight from the integer bit length: one division, no loop
+    i = min((int(n).bit_length()-1)//10, 5) if n >= 1 else 0
+    return f"{n/(1<<(10*i)):.2f} {_BYTE_UNITS[i]}"
+
+def _dir_usage(path: str) -> tuple[int, float]:
+    """
+    Sum file sizes and find the newest mtime under a directory in one walk.
+
+    Symlinks are not followed, so HF cache snapshots (symlinks into blobs/)
+    are only counted once through the blobs themselves.
+
+    Args:
+        path: Directory to measure
+
+    Returns:
+        (total size in bytes, newest file mtime or 0.0 if there are no files);
+        unreadable entries are skipped
+    """
+    total = 0; newest = 0.0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            st = entry.stat(follow_symlinks=False)
+                            total += st.st_size
+                            if st.st_mtime > newest: newest = st.st_mtime
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total, newest
+
+def _dir_size(path: str) -> int:
+    """
+    Sum file sizes under a directory without spawning an external `du`.
+
+    Args:
+        path: Directory to measure
+
+    Returns:
+        Total size in bytes (see _dir_usage for symlink handling)
+    """
+    return _dir_usage(path)[0]
+
+_TOK_COUNTERS = weakref.WeakKeyDictionary()  # tokenizer -> counter known to work for it
+
+def _count_via_encode(tokenizer: any, text: str) -> int: return len(tokenizer.encode(text))
+def _count_via_encode_ids(tokenizer: any, text: str) -> int: return len(tokenizer.encode(text).ids)
 
 def _count_tokens(tokenizer: any, text: str) -> int:
     """
     Count tokens in text using the provided tokenizer.
 
+    The first successful encode() shape is remembered per tokenizer, so later
+    calls dispatch straight to it instead of re-probing.
+
     Args:
         tokenizer: Model tokenizer
         text: Text to tokenize
@@ -473,11 +756,22 @@ def _count_tokens(tokenizer: any, text: str) -> int:
     Returns:
         Approximate token count (fallback: len(text)/4)
     """
+    try:
+        fn = _TOK_COUNTERS.get(tokenizer)
+    except TypeError:
+        fn = None
+    if fn is not None:
+        try: return fn(tokenizer, text)
+        except Exception: pass
     try:
         if hasattr(tokenizer,"encode"):
-            ids = tokenizer.encode(text)
-            if isinstance(ids,list): return len(ids)
-            if hasattr(ids,"ids"): return len(ids.ids)
+            ids = tokenizer.encode(text); fn = None
+            if isinstance(ids,list): n, fn = len(ids), _count_via_encode
+            elif hasattr(ids,"ids"): n, fn = len(ids.ids), _count_via_encode_ids
+            if fn is not None:
+                try: _TOK_COUNTERS[tokenizer] = fn
+                except TypeError: pass
+                return n
     except Exception: pass
     try:
         out = tokenizer(text)
@@ -494,6 +788,28 @@ def _count_tokens(tokenizer: any, text: str) -> int:
     except Exception: pass
     return max(1,int(len(text)/4))
 
+def _count_suffix_tokens(tokenizer: any, text: str) -> int:
+    """
+    Count tokens in a continuation of an already-counted prompt.
+
+    encode() usually prepends BOS (or other special tokens), which would be
+    counted again for every appended suffix; ask for the bare tokens instead.
+
+    Args:
+        tokenizer: Model tokenizer
+        text: Text appended to the previous prompt
+
+    Returns:
+        Token count without special tokens where the tokenizer supports it,
+        otherwise the same count as _count_tokens()
+    """
+    try:
+        ids = tokenizer.encode(text, add_special_tokens=False)
+        if isinstance(ids, list): return len(ids)
+        if hasattr(ids, "ids"): return len(ids.ids)
+    except Exception: pass
+    return _count_tokens(tokenizer, text)
+
 def _estimate_kv_bytes(layers: int, hidden_size: int, ctx_tokens: int, dtype_bytes: int = 2, batch: int = 1) -> int:
     """
     Estimate KV cache memory usage.
@@ -513,6 +829,42 @@ def _estimate_kv_bytes(layers: int, hidden_size: int, ctx_tokens: int, dtype_byt
     return int(layers*ctx_tokens*per_tok_per_layer*batch)
 
 # ===== Streaming helper (Harmony final only) =====
+_HARMONY_MARKER = "<|channel|>final<|message|>"
+_HARMONY_END = ("<|end|>", "<|start|>")
+_HARMONY_END_RE = re.compile("|".join(map(re.escape, _HARMONY_END)))  # earliest end marker in one pass
+_HARMONY_KEEP = max(len(m) for m in _HARMONY_END) + 64  # longest end marker (10) + buffer margin
+_HARMONY_PRE_KEEP = len(_HARMONY_MARKER) + 64  # tail kept while waiting for the final marker
+_HARMONY_END_OVERLAP = max(len(m) for m in _HARMONY_END) - 1  # chars of old buffer an end marker can straddle
+
+def _strip_harmony_tags(s: str) -> str:
+    """
+    Remove <|...|> control tags (no '>' inside) with str.find scans.
+
+    Equivalent to re.sub(r"<\\|[^>]*\\|>", "", s); chunks without "<|" are
+    returned as-is.
+
+    Args:
+        s: Text chunk
+
+    Returns:
+        Text with Harmony control tags removed
+    """
+    j = s.find("<|")
+    if j < 0:
+        return s
+    out = []; i = 0
+    while j >= 0:
+        k = s.find("|>", j+2)
+        if k < 0:
+            break
+        if s.find(">", j+2) == k+1:  # no '>' before the closer: a real tag
+            out.append(s[i:j]); i = k+2
+            j = s.find("<|", i)
+        else:
+            j = s.find("<|", j+2)
+    out.append(s[i:])
+    return "".join(out)
+
 def _stream_final_from_harmony(token_iter: any) -> any:
     """
     Extract and stream only the final channel content from Harmony output.
@@ -526,38 +878,32 @@ def _stream_final_from_harmony(token_iter: any) -> any:
     Yields:
         Cleaned text chunks from the final channel
     """
-    import re
     buf=""; in_final=False
-    marker="<|channel|>final<|message|>"; end_markers=("<|end|>","<|start|>")
-    marker_max_len = max(len(m) for m in end_markers)  # = 10 (<|start|>)
-    keep_buffer = marker_max_len + 64  # marker length + buffer margin
-
-    def _clean(s:str)->str: return re.sub(r"<\|[^>]*\|>","",s)
+    marker=_HARMONY_MARKER; keep_buffer=_HARMONY_KEEP
+    _clean=_strip_harmony_tags; _end_search=_HARMONY_END_RE.search
     for t in token_iter:
+        # Only the new text plus a marker-sized overlap can hold a match that
+        # wasn't already ruled out, so start each search there.
+        start=len(buf)
         buf+=t
         if not in_final:
-            idx=buf.find(marker)
-            if idx!=-1:
-                in_final=True
-                leftover=buf[idx+len(marker):]
-                if leftover: yield _clean(leftover)
-                buf=""
-            else:
-                if len(buf)>len(marker)+64: buf=buf[-(len(marker)+64):]
-        else:
-            end_idx=-1
-            for m in end_markers:
-                i=buf.find(m)
-                if i!=-1:
-                    end_idx = i if end_idx==-1 else min(end_idx,i)
-            if end_idx!=-1:
-                chunk=buf[:end_idx]
-                if chunk: yield _clean(chunk)
-                break
-            # Buffer size management (dynamic, previously fixed at 256)
-            if len(buf) > keep_buffer * 4:  # flush when buffer exceeds 4x marker length
-                flush=buf[:-keep_buffer]
-                buf=buf[-keep_buffer:]
-                if flush: yield _clean(flush)
+            idx=buf.find(marker, max(0, start-len(marker)+1))
+            if idx==-1:
+                if len(buf)>_HARMONY_PRE_KEEP: buf=buf[-_HARMONY_PRE_KEEP:]
+                continue
+            in_final=True
+            buf=buf[idx+len(marker):]
+            start=0
+        m=_end_search(buf, max(0, start-_HARMONY_END_OVERLAP))
+        if m:
+            chunk=buf[:m.start()]
+            if chunk: yield _clean(chunk)
+            buf=""
+            break
+        # Buffer size management (dynamic, previously fixed at 256)
+        if len(buf) > keep_buffer * 4:  # flush when buffer exceeds 4x marker length
+            flush=buf[:-keep_buffer]
+            buf=buf[-keep_buffer:]
+            if flush: yield _clean(flush)
     if in_final and buf:
         yield _clean(buf)
@@ -21,7 +21,9 @@ from commands import (
     list_models,
     show_info,
     alias_main,
+    alias_interactive,
     cmd_doctor,
+    run_model,
     _list_cached_models_all,
     _sync_alias_from_cache,
 )
@@ -70,11 +72,9 @@ class TestListModels:
     @patch('commands.list.os.path.isdir')
     @patch('commands.list.os.scandir')
     @patch('commands.list.load_alias_dict')
-    @patch('commands.list.subprocess.check_output')
-    @patch('commands.list.os.walk')
-    @patch('commands.list.os.path.getmtime')
+    @patch('commands.list._dir_usage')
     def test_list_models_with_aliases(
-        self, mock_getmtime, mock_walk, mock_subprocess, mock_load_alias,
+        self, mock_dir_usage, mock_load_alias,
         mock_scandir, mock_isdir, mock_listdir, mock_exists, mock_expanduser, capsys
     ):
         """Test listing models with aliases displayed"""
@@ -93,9 +93,7 @@ class TestListModels:
             "models--google--gemma-3-27b-it": "gemma3",
             "models--meta--llama3-8b": ""
         }
-        mock_subprocess.return_value = b"5.2G\t/path"
-        mock_walk.return_value = [("/root", [], ["file1.txt"])]
-        mock_getmtime.return_value = 1700000000.0
+        mock_dir_usage.return_value = (5 * 1024 ** 3, 1700000000.0)
 
         # Run
         list_models()
@@ -105,6 +103,7 @@ class TestListModels:
         assert "Installed MLX Models" in captured.out
         assert "models--google--gemma-3-27b-it" in captured.out
         assert "gemma3" in captured.out
+        assert "5.00 GB" in captured.out
 
     @patch('commands.list.os.path.exists')
     def test_list_models_no_directory(self, mock_exists, capsys):
@@ -122,17 +121,21 @@ class TestListModels:
 class TestShowInfo:
     """Tests for model info display"""
 
-    @patch('commands.show.load_alias_dict')
+    @patch('commands.show.load_alias_maps')
     @patch('commands.show.os.path.exists')
-    @patch('commands.show.subprocess.check_output')
+    @patch('commands.show._dir_size')
     @patch('commands.show.load_config_for_model')
     def test_show_info_success(
-        self, mock_load_config, mock_subprocess, mock_exists, mock_load_alias, capsys
+        self, mock_load_config, mock_dir_size, mock_exists, mock_load_alias, capsys
     ):
         """Test showing model info successfully"""
-        mock_load_alias.return_value = {"models--google--gemma-3-27b-it": "gemma3"}
+        mock_load_alias.return_value = (
+            {"models--google--gemma-3-27b-it": "gemma3"},
+            {"gemma3": "models--google--gemma-3-27b-it"},
+            {"models--google--gemma-3-27b-it": "models--google--gemma-3-27b-it"},
+        )
         mock_exists.return_value = True
-        mock_subprocess.return_value = b"5.2G\t/path"
+        mock_dir_size.return_value = 5 * 1024 ** 3
         mock_load_config.return_value = {
             "architectures": ["GemmaForCausalLM"],
             "hidden_size": 4096,
@@ -146,12 +149,13 @@ class TestShowInfo:
         assert "MODEL INFO" in captured.out
         assert "gemma3" in captured.out
         assert "4096" in captured.out
+        assert "5.00 GB" in captured.out
 
-    @patch('commands.show.load_alias_dict')
+    @patch('commands.show.load_alias_maps')
     @patch('commands.show.os.path.exists')
     def test_show_info_not_found(self, mock_exists, mock_load_alias, capsys):
         """Test showing info for non-existent model"""
-        mock_load_alias.return_value = {}
+        mock_load_alias.return_value = ({}, {}, {})
         mock_exists.return_value = False
 
         show_info("nonexistent")
@@ -167,24 +171,22 @@ class TestAliasManagement:
 
     @patch('commands.alias._sync_alias_from_cache')
     @patch('commands.alias.load_alias_dict')
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('commands.alias.alias_file_path', '/tmp/.mlxlm_aliases.json')
-    def test_alias_add(self, mock_file, mock_load_alias, mock_sync, capsys):
+    @patch('commands.alias.save_alias_dict')
+    def test_alias_add(self, mock_save, mock_load_alias, mock_sync, capsys):
         """Test adding a new alias"""
         mock_load_alias.return_value = {}
 
         alias_main(["add", "google/gemma-3-27b-it", "gemma3"])
 
         # Verify file was written
-        mock_file.assert_called()
+        mock_save.assert_called_once_with({"models--google--gemma-3-27b-it": "gemma3"})
         captured = capsys.readouterr()
         assert "Added alias" in captured.out or "gemma3" in captured.out
 
     @patch('commands.alias._sync_alias_from_cache')
     @patch('commands.alias.load_alias_dict')
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('commands.alias.alias_file_path', '/tmp/.mlxlm_aliases.json')
-    def test_alias_remove(self, mock_file, mock_load_alias, mock_sync, capsys):
+    @patch('commands.alias.save_alias_dict')
+    def test_alias_remove(self, mock_save, mock_load_alias, mock_sync, capsys):
         """Test removing an alias"""
         mock_load_alias.return_value = {
             "models--google--gemma-3-27b-it": "gemma3"
@@ -192,6 +194,7 @@ class TestAliasManagement:
 
         alias_main(["remove", "gemma3"])
 
+        mock_save.assert_called_once()
         captured = capsys.readouterr()
         assert "Removed" in captured.out or "gemma3" in captured.out
 
@@ -212,9 +215,8 @@ class TestAliasManagement:
 
     @patch('commands.alias._sync_alias_from_cache')
     @patch('commands.alias.load_alias_dict')
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('commands.alias.alias_file_path', '/tmp/.mlxlm_aliases.json')
-    def test_alias_edit(self, mock_file, mock_load_alias, mock_sync, capsys):
+    @patch('commands.alias.save_alias_dict')
+    def test_alias_edit(self, mock_save, mock_load_alias, mock_sync, capsys):
         """Test editing an existing alias"""
         mock_load_alias.return_value = {
             "models--google--gemma-3-27b-it": "gemma3"
@@ -222,10 +224,33 @@ class TestAliasManagement:
 
         alias_main(["edit", "gemma3", "gemma-new"])
 
+        mock_save.assert_called_once_with({"models--google--gemma-3-27b-it": "gemma-new"})
         captured = capsys.readouterr()
         assert "Changed" in captured.out or "gemma" in captured.out
 
 
+    @patch('commands.alias._sync_alias_from_cache')
+    @patch('commands.alias._list_cached_models_all')
+    @patch('commands.alias.load_alias_dict')
+    @patch('commands.alias.save_alias_dict')
+    @patch('builtins.input', side_effect=["1", "gemma3", "y", "0"])
+    def test_alias_interactive_reuses_state(
+        self, mock_input, mock_save, mock_load_alias, mock_list_models, mock_sync, capsys
+    ):
+        """Test that the menu loop does not reload aliases or rescan the hub after a write"""
+        mock_list_models.return_value = ["models--google--gemma-3-27b-it"]
+        mock_load_alias.return_value = {"models--google--gemma-3-27b-it": ""}
+
+        with patch('commands.alias.os.stat', return_value=MagicMock(st_mtime_ns=1)):
+            alias_interactive()
+
+        captured = capsys.readouterr()
+        assert "Alias 'gemma3' added successfully" in captured.out
+        assert "[gemma3]" in captured.out
+        mock_load_alias.assert_called_once()
+        mock_list_models.assert_called_once()
+
+
 # ===== Tests: cmd_doctor =====
 
 class TestDoctor:
@@ -273,41 +298,195 @@ class TestDoctor:
         assert "mlxlm doctor" in captured.out
 
 
+# ===== Tests: run_model =====
+
+class TestRunModel:
+    """Tests for interactive chat streaming"""
+
+    @staticmethod
+    def _resps(*texts):
+        return [MagicMock(text=t) for t in texts]
+
+    @patch('commands.run.load_config_for_model', return_value={})
+    @patch('commands.run.load_alias_dict', return_value={})
+    @patch('mlx_lm.stream_generate')
+    @patch('mlx_lm.load')
+    @patch('builtins.input', side_effect=["Hello", "/exit"])
+    def test_run_model_streams_all(
+        self, mock_input, mock_load, mock_stream, mock_alias, mock_cfg, capsys
+    ):
+        """Test that streamed tokens are written to stdout in order"""
+        mock_load.return_value = (MagicMock(), MagicMock())
+        mock_stream.return_value = iter(self._resps("Hi", " there", "!\n", "Bye"))
+
+        run_model("test-model", chat_mode="plain")
+
+        captured = capsys.readouterr()
+        assert "Hi there!\nBye" in captured.out
+        assert "Bye!" in captured.out
+
+    @patch('commands.run.load_config_for_model', return_value={})
+    @patch('commands.run.load_alias_dict', return_value={})
+    @patch('mlx_lm.stream_generate')
+    @patch('mlx_lm.load')
+    @patch('builtins.input', side_effect=["one", "two", "/exit"])
+    def test_run_model_counts_only_prompt_delta(
+        self, mock_input, mock_load, mock_stream, mock_alias, mock_cfg, capsys
+    ):
+        """Test that an append-only prompt is re-tokenized only for the new suffix, without a second BOS"""
+        tokenizer = MagicMock()
+        tokenizer.apply_chat_template.side_effect = lambda msgs, **kw: "".join(
+            f"[{m['role']}]{m['content']}" for m in msgs
+        )
+        # One BOS id per encode() unless special tokens are turned off
+        tokenizer.encode.side_effect = lambda text, add_special_tokens=True: [0] * add_special_tokens + list(text)
+        mock_load.return_value = (MagicMock(), tokenizer)
+        mock_stream.side_effect = lambda *a, **kw: iter(self._resps("ok"))
+
+        run_model("test-model", chat_mode="hf", system_prompt="")
+
+        encoded = [c.args[0] for c in tokenizer.encode.call_args_list]
+        assert encoded == ["[user]one", "[assistant]ok[user]two"]
+        assert "prompt≈32" in capsys.readouterr().out
+
+    @patch('commands.run.load_config_for_model', return_value={})
+    @patch('commands.run.load_alias_dict', return_value={})
+    @patch('mlx_lm.stream_generate')
+    @patch('mlx_lm.load')
+    @patch('builtins.input', side_effect=["Hello", "/exit"])
+    def test_run_model_stop_fallback_split_token(
+        self, mock_input, mock_load, mock_stream, mock_alias, mock_cfg, capsys
+    ):
+        """Test that a stop sequence split across tokens ends the stream without stop= support"""
+        mock_load.return_value = (MagicMock(), MagicMock())
+        mock_stream.return_value = iter(self._resps("answer", " ST", "OP", "never shown"))
+
+        run_model("test-model", chat_mode="plain", stop=["STOP"])
+
+        captured = capsys.readouterr()
+        assert "answer STOP" in captured.out
+        assert "never shown" not in captured.out
+        assert "stop" not in mock_stream.call_args.kwargs
+
+    @patch('commands.run.time.monotonic_ns', side_effect=[0, 0, 5 * 10**9])
+    @patch('commands.run.load_config_for_model', return_value={})
+    @patch('commands.run.load_alias_dict', return_value={})
+    @patch('mlx_lm.stream_generate')
+    @patch('mlx_lm.load')
+    @patch('builtins.input', side_effect=["Hello", "/exit"])
+    def test_run_model_time_limit(
+        self, mock_input, mock_load, mock_stream, mock_alias, mock_cfg, mock_clock, capsys
+    ):
+        """Test that the time limit is checked every 8 tokens and stops the stream"""
+        mock_load.return_value = (MagicMock(), MagicMock())
+        mock_stream.return_value = iter(self._resps(*[f"t{i} " for i in range(20)]))
+
+        run_model("test-model", chat_mode="plain", time_limit=1)
+
+        captured = capsys.readouterr()
+        assert "t8 " in captured.out
+        assert "t9 " not in captured.out
+        assert "Time limit reached" in captured.out
+
+    @patch('commands.run.time.monotonic_ns', side_effect=[0, 0, 5 * 10**9])
+    @patch('commands.run._stream_final_from_harmony')
+    @patch('commands.run.load_config_for_model', return_value={})
+    @patch('commands.run.load_alias_dict', return_value={})
+    @patch('mlx_lm.stream_generate')
+    @patch('mlx_lm.load')
+    @patch('builtins.input', side_effect=["Hello", "/exit"])
+    def test_run_model_time_limit_final(
+        self, mock_input, mock_load, mock_stream, mock_alias, mock_cfg, mock_final, mock_clock, capsys
+    ):
+        """Test that final mode checks the time limit on every extracted chunk"""
+        mock_load.return_value = (MagicMock(), MagicMock())
+        mock_stream.return_value = iter(())
+        mock_final.return_value = iter(["first ", "second ", "third "])
+
+        run_model("test-model", chat_mode="harmony", stream_mode="final", time_limit=1)
+
+        captured = capsys.readouterr()
+        assert "first second " in captured.out
+        assert "third" not in captured.out
+        assert "Time limit reached" in captured.out
+
+    @patch('commands.run._render_prompt', return_value="[user]Hello[assistant]")
+    @patch('commands.run.load_config_for_model', return_value={})
+    @patch('commands.run.load_alias_dict', return_value={})
+    @patch('mlx_lm.stream_generate')
+    @patch('mlx_lm.load')
+    @patch('builtins.input', side_effect=["Hello", "/exit"])
+    def test_run_model_final_auto_without_harmony(
+        self, mock_input, mock_load, mock_stream, mock_alias, mock_cfg, mock_render, capsys
+    ):
+        """Test that final mode streams everything when auto chat renders a non-Harmony prompt"""
+        mock_load.return_value = (MagicMock(), MagicMock())
+        mock_stream.return_value = iter(self._resps("plain", " answer"))
+
+        run_model("test-model", chat_mode="auto", stream_mode="final")
+
+        assert "plain answer" in capsys.readouterr().out
+
+    @patch('commands.run.load_config_for_model', return_value={})
+    @patch('commands.run.load_alias_dict', return_value={})
+    @patch('mlx_lm.stream_generate')
+    @patch('mlx_lm.load')
+    @patch('builtins.input', side_effect=["Hello", "/exit"])
+    def test_run_model_flushes_on_interrupt(
+        self, mock_input, mock_load, mock_stream, mock_alias, mock_cfg, capsys
+    ):
+        """Test that batched tokens are still written when generation is interrupted"""
+        def interrupted():
+            yield from self._resps("partial", " answer")
+            raise KeyboardInterrupt
+
+        mock_load.return_value = (MagicMock(), MagicMock())
+        mock_stream.return_value = interrupted()
+
+        with pytest.raises(KeyboardInterrupt):
+            run_model("test-model", chat_mode="plain")
+
+        assert "partial answer" in capsys.readouterr().out
+
+    def test_accepts_stop(self):
+        """Test that stop= support is detected from the signature"""
+        from commands.run import _accepts_stop
+
+        def with_stop(model, tokenizer, prompt, max_tokens=256, stop=None): pass
+        def without_stop(model, tokenizer, prompt, max_tokens=256, **kwargs): pass
+
+        assert _accepts_stop(with_stop) is True
+        assert _accepts_stop(without_stop) is False
+
+
 # ===== Tests: Helper functions =====
 
 class TestHelperFunctions:
     """Tests for internal helper functions"""
 
-    @patch('commands.alias.os.path.isdir')
-    @patch('commands.alias.os.listdir')
-    @patch('commands.alias.os.scandir')
-    def test_list_cached_models_all(self, mock_scandir, mock_listdir, mock_isdir):
+    def test_list_cached_models_all(self, mock_hub_dir):
         """Test listing all cached models"""
-        mock_isdir.side_effect = lambda path: "hub" in path or "models--" in path
-        mock_listdir.return_value = [
-            "models--google--gemma-3-27b-it",
-            "models--meta--llama3-8b",
-            "not-a-model"
-        ]
+        hub = Path(mock_hub_dir)
+        (hub / "not-a-model").mkdir()
+        (hub / "models--org--empty").mkdir()
+        (hub / "models--org--cloned").mkdir()
+        (hub / "models--org--cloned" / "config.json").write_text("{}")
 
-        # Mock scandir for snapshots
-        mock_entry = MagicMock()
-        mock_entry.is_dir.return_value = True
-        mock_scandir.return_value = [mock_entry]
-
-        with patch('commands.alias.os.path.expanduser', return_value="/home/user/.cache/huggingface/hub"):
+        with patch('commands.alias.HF_CACHE_PATH', mock_hub_dir):
             result = _list_cached_models_all()
 
-        assert "models--google--gemma-3-27b-it" in result
-        assert "models--meta--llama3-8b" in result
+        assert result == [
+            "models--google--gemma-3-27b-it",
+            "models--meta--llama3-8b",
+            "models--org--cloned",
+        ]
         assert "not-a-model" not in result
 
     @patch('commands.alias._list_cached_models_all')
     @patch('commands.alias.load_alias_dict')
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('commands.alias.alias_file_path', '/tmp/.mlxlm_aliases.json')
+    @patch('commands.alias.save_alias_dict')
     def test_sync_alias_from_cache_new_models(
-        self, mock_file, mock_load_alias, mock_list_models, capsys
+        self, mock_save, mock_load_alias, mock_list_models, capsys
     ):
         """Test syncing aliases when new models are found"""
         mock_list_models.return_value = [
@@ -323,7 +502,10 @@ class TestHelperFunctions:
         # Should add the new model to alias file
         captured = capsys.readouterr()
         # Sync should update file when new models found
-        # (File write is mocked, just verify no crash)
+        mock_save.assert_called_once_with({
+            "models--google--gemma-3-27b-it": "gemma3",
+            "models--meta--llama3-8b": "",
+        })
 
 
 # ===== Summary =====
@@ -332,9 +514,10 @@ class TestHelperFunctions:
 Test summary:
 - 2 list_models tests
 - 2 show_info tests
-- 4 alias_main tests (add/edit/remove/list)
+- 5 alias tests (add/edit/remove/list/interactive)
 - 2 cmd_doctor tests
+- 8 run_model tests
 - 2 helper function tests
 
-Total: 12 unit tests for commands.py
+Total: 21 unit tests for commands.py
 """
@@ -18,6 +18,8 @@ from unittest.mock import patch, mock_open, MagicMock
 # Import functions to test
 from core import (
     load_alias_dict,
+    invalidate_alias_cache,
+    save_alias_dict,
     resolve_model_name,
     repo_to_cache_name,
     resolve_to_cache_key,
@@ -26,9 +28,23 @@ from core import (
     _render_plain,
     render_harmony_simple,
     _human_bytes,
+    _dir_size,
+    _dir_usage,
     _count_tokens,
     _estimate_kv_bytes,
     _apply_reasoning_to_system,
+    _stream_final_from_harmony,
+    _strip_harmony_tags,
+    _detect_harmony_renderer,
+    load_alias_maps,
+    _get_model_type,
+    _render_hf_template,
+    _TOK_HAS_TEMPLATE,
+    _pick_renderer,
+    _load_callable_from_path,
+    _TOK_COUNTERS,
+    _count_via_encode_ids,
+    _hf_api,
 )
 
 
@@ -80,6 +96,83 @@ class TestAliasLoading:
 
         assert result == {}
 
+    def test_load_alias_dict_cached_until_file_changes(self, mock_alias_file):
+        """Test the alias file is parsed once and re-read only after it changes"""
+        alias_path, expected = mock_alias_file
+
+        with patch('core.alias_file_path', alias_path), \
+             patch('core.json.load', wraps=json.load) as mock_load:
+            first = load_alias_dict()
+            first["models--new--model"] = "mutated"
+            second = load_alias_dict()
+            Path(alias_path).write_text(json.dumps({"models--x--y": "xy"}))
+            third = load_alias_dict()
+
+        assert second == expected
+        assert third == {"models--x--y": "xy"}
+        assert mock_load.call_count == 2
+
+    def test_invalidate_alias_cache_after_same_stat_rewrite(self, mock_alias_file):
+        """Test writers can force a reload when a rewrite keeps size and mtime"""
+        alias_path, _ = mock_alias_file
+        st = os.stat(alias_path)
+
+        with patch('core.alias_file_path', alias_path):
+            load_alias_dict()
+            Path(alias_path).write_text(json.dumps({"models--a--b": "x1"}).ljust(st.st_size))
+            os.utime(alias_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            stale = load_alias_dict()
+            invalidate_alias_cache()
+            fresh = load_alias_dict()
+
+        assert "models--a--b" not in stale
+        assert fresh == {"models--a--b": "x1"}
+
+    def test_save_alias_dict_atomic_and_skips_noop(self, mock_alias_file):
+        """Test saving writes via a temp file, reloads fresh data, and skips unchanged dicts"""
+        alias_path, expected = mock_alias_file
+
+        with patch('core.alias_file_path', alias_path):
+            aliases = load_alias_dict()
+            assert save_alias_dict(aliases) is False
+
+            aliases["models--new--model"] = "new"
+            with patch('core.os.replace', wraps=os.replace) as mock_replace:
+                assert save_alias_dict(aliases) is True
+            mock_replace.assert_called_once_with(alias_path + ".tmp", alias_path)
+
+            assert load_alias_dict() == {**expected, "models--new--model": "new"}
+            assert save_alias_dict(load_alias_dict()) is False
+        assert not os.path.exists(alias_path + ".tmp")
+
+    def test_save_alias_dict_keeps_mode_and_cleans_up(self, mock_alias_file):
+        """Test saving keeps the file's permissions and removes the temp file on failure"""
+        alias_path, expected = mock_alias_file
+        os.chmod(alias_path, 0o600)
+
+        assert save_alias_dict({"models--a--b": "ab"}, alias_path) is True
+        assert os.stat(alias_path).st_mode & 0o777 == 0o600
+
+        with pytest.raises(TypeError):
+            save_alias_dict({"models--a--b": object()}, alias_path)
+        assert not os.path.exists(alias_path + ".tmp")
+        assert json.loads(Path(alias_path).read_text()) == {"models--a--b": "ab"}
+
+    def test_save_alias_dict_custom_path_invalidates_that_file(self, mock_alias_file, tmp_path):
+        """Test saving to a custom path drops that file's parse and keeps the default one"""
+        alias_path, expected = mock_alias_file
+        other = tmp_path / "other.json"
+        other.write_text(json.dumps({"models--a--b": "ab"}))
+
+        with patch('core.alias_file_path', alias_path), \
+             patch('core.json.load', wraps=json.load) as mock_load:
+            load_alias_dict()
+            assert save_alias_dict({"models--c--d": "cd"}, str(other)) is True
+            assert load_alias_dict() == expected
+
+        assert mock_load.call_count == 1
+        assert json.loads(other.read_text()) == {"models--c--d": "cd"}
+
 
 # ===== Tests: Name resolution =====
 
@@ -105,6 +198,33 @@ class TestNameResolution:
         result = resolve_model_name("GEMMA3", alias_dict)
         assert result == "google/gemma-3-27b-it"
 
+    def test_load_alias_maps_built_once_per_parse(self, mock_alias_file):
+        """Test lowercase alias maps are reused until the alias file changes"""
+        alias_path, expected = mock_alias_file
+
+        with patch('core.alias_file_path', alias_path):
+            alias_dict, alias_map_lower, names_lower = load_alias_maps()
+            _, again, _ = load_alias_maps()
+            Path(alias_path).write_text(json.dumps({"models--x--y": "XY"}))
+            _, changed, _ = load_alias_maps()
+
+        assert alias_dict == expected and type(alias_dict) is dict
+        assert again is alias_map_lower
+        assert alias_map_lower["gemma3"] == "models--google--gemma-3-27b-it"
+        assert names_lower["models--meta--llama3-8b"] == "models--meta--llama3-8b"
+        assert changed == {"xy": "models--x--y"}
+
+    def test_resolve_with_loaded_maps(self, mock_alias_file):
+        """Test resolvers use maps from load_alias_maps and rebuild them for edited dicts"""
+        alias_path, _ = mock_alias_file
+
+        with patch('core.alias_file_path', alias_path):
+            alias_dict, *maps = load_alias_maps()
+
+        assert resolve_to_cache_key("GEMMA3", alias_dict, maps) == "models--google--gemma-3-27b-it"
+        alias_dict["models--new--model"] = "NewAlias"
+        assert resolve_to_cache_key("newalias", alias_dict) == "models--new--model"
+
     def test_resolve_model_name_with_slash(self):
         """Test resolving org/repo format (passthrough)"""
         alias_dict = {}
@@ -147,23 +267,82 @@ class TestNameResolution:
 class TestConfigLoading:
     """Tests for model config loading"""
 
-    @patch('core.HfApi')
-    def test_load_config_from_hf_api(self, mock_hf_api):
+    @pytest.fixture(autouse=True)
+    def fresh_hf_client(self):
+        """Drop the shared HfApi client so each test builds one from its patched class"""
+        _hf_api.cache_clear()
+        yield
+        _hf_api.cache_clear()
+
+    @patch('huggingface_hub.HfApi')
+    def test_load_config_from_hf_api(self, mock_hf_api, tmp_path):
         """Test loading config from HuggingFace API"""
         mock_config = {"model_type": "gemma", "hidden_size": 4096}
         mock_hf_api.return_value.model_info.return_value.config = mock_config
 
-        result = load_config_for_model("models--google--gemma-3-27b-it")
+        # Empty hub dir so a real local snapshot can't short-circuit the API
+        with patch('core.HF_CACHE_PATH', str(tmp_path)):
+            result = load_config_for_model("models--google--gemma-3-27b-it")
 
         assert result == mock_config
 
-    @patch('core.HfApi')
-    def test_load_config_offline_fallback(self, mock_hf_api):
+    @patch('huggingface_hub.HfApi')
+    def test_load_config_reuses_hf_client(self, mock_hf_api, tmp_path):
+        """Test repeated lookups share a single HfApi client"""
+        mock_hf_api.return_value.model_info.return_value.config = {"model_type": "gemma"}
+
+        with patch('core.HF_CACHE_PATH', str(tmp_path)):
+            load_config_for_model("models--google--gemma-3-27b-it")
+            load_config_for_model("models--meta--llama3-8b")
+
+        assert mock_hf_api.call_count == 1
+        assert mock_hf_api.return_value.model_info.call_count == 2
+
+    @patch('huggingface_hub.HfApi')
+    def test_load_config_prefers_local_snapshot(self, mock_hf_api, tmp_path):
+        """Test a cached config.json is used without calling the HF API"""
+        snap = tmp_path / "models--test--model" / "snapshots" / "abc123"
+        snap.mkdir(parents=True)
+        (snap / "config.json").write_text(json.dumps({"model_type": "llama"}))
+
+        with patch('core.HF_CACHE_PATH', str(tmp_path)):
+            result = load_config_for_model("models--test--model")
+
+        assert result == {"model_type": "llama"}
+        mock_hf_api.return_value.model_info.assert_not_called()
+
+    def test_load_config_newest_readable_snapshot(self, tmp_path):
+        """Test the newest snapshot wins and a corrupt one falls back to an older one"""
+        base = tmp_path / "models--test--model" / "snapshots"
+        for name, mtime, body in (("old", 1000, '{"v": 1}'), ("mid", 2000, '{"v": 2}'), ("new", 3000, "{ bad")):
+            (base / name).mkdir(parents=True)
+            (base / name / "config.json").write_text(body)
+            os.utime(base / name, (mtime, mtime))
+
+        with patch('core.HF_CACHE_PATH', str(tmp_path)), patch.dict(os.environ, {'MLXLM_OFFLINE': '1'}):
+            result = load_config_for_model("models--test--model")
+
+        assert result == {"v": 2}
+
+    @patch.dict('core._MODEL_TYPES', clear=True)
+    @patch('core.load_config_for_model')
+    def test_get_model_type_cached(self, mock_load_config):
+        """Test model type detection loads the config once per model"""
+        mock_load_config.return_value = {"model_type": "GPT_OSS"}
+        alias_dict = {"models--openai--gpt-oss-20b": "oss"}
+
+        assert _get_model_type("oss", alias_dict) == "gpt_oss"
+        assert _get_model_type("openai/gpt-oss-20b", alias_dict) == "gpt_oss"
+
+        mock_load_config.assert_called_once_with("models--openai--gpt-oss-20b")
+
+    @patch('huggingface_hub.HfApi')
+    def test_load_config_offline_fallback(self, mock_hf_api, tmp_path):
         """Test fallback to local cache when API fails"""
         mock_hf_api.return_value.model_info.side_effect = Exception("Network error")
 
-        # Mock local cache
-        with patch.dict(os.environ, {'MLXLM_OFFLINE': '1'}):
+        # Mock local cache (empty hub dir)
+        with patch.dict(os.environ, {'MLXLM_OFFLINE': '1'}), patch('core.HF_CACHE_PATH', str(tmp_path)):
             result = load_config_for_model("models--test--model")
 
         # Should return empty dict when no local cache exists
@@ -230,6 +409,106 @@ class TestRendering:
         result_no_reasoning = _apply_reasoning_to_system(system, None)
         assert result_no_reasoning == "You are helpful"
 
+    def test_render_hf_template_caches_capability(self):
+        """Test chat_template capability is probed once per tokenizer object"""
+        class PlainTokenizer:
+            pass
+
+        class ChatTokenizer:
+            def apply_chat_template(self, messages, tokenize, add_generation_prompt):
+                return "|".join(m["content"] for m in messages)
+
+        plain, chat = PlainTokenizer(), ChatTokenizer()
+        messages = [{"role": "user", "content": "Hi"}]
+
+        assert _render_hf_template(plain, messages) is None
+        assert _render_hf_template(chat, messages) == "Hi"
+        assert _TOK_HAS_TEMPLATE[plain] is False
+        assert _TOK_HAS_TEMPLATE[chat] is True
+
+    def test_pick_renderer_registry_order(self):
+        """Test known names win, then renderer classes, then the render*/format* scan"""
+        import types
+
+        def render_chat(messages): return "named"
+        def render_custom(messages): return "scanned"
+
+        class Renderer:
+            def render(self, messages): return "class"
+
+        assert _pick_renderer(types.SimpleNamespace(render_chat=render_chat, render_custom=render_custom, Renderer=Renderer))([]) == "named"
+        assert _pick_renderer(types.SimpleNamespace(render_custom=render_custom, Renderer=Renderer))([]) == "class"
+        assert _pick_renderer(types.SimpleNamespace(render_custom=render_custom))([]) == "scanned"
+        assert _pick_renderer(types.SimpleNamespace()) is None
+
+    def test_load_callable_from_path_prefers_module_functions(self):
+        """Test an explicit module spec returns its first render*/format* function before any class"""
+        import sys, types
+
+        mod = types.ModuleType("fake_renderer_mod")
+        def render_custom(*messages): return "function"
+        class Renderer:
+            def render(self, messages): return "class"
+        mod.render_custom, mod.Renderer = render_custom, Renderer
+
+        with patch.dict(sys.modules, {"fake_renderer_mod": mod}):
+            assert _load_callable_from_path("fake_renderer_mod") is render_custom
+            assert _load_callable_from_path("fake_renderer_mod:Renderer")([]) == "class"
+
+    @patch.dict('core._HARMONY_RENDERERS', clear=True)
+    @patch('core._find_harmony_renderer')
+    def test_detect_harmony_renderer_cached(self, mock_find):
+        """Test renderer detection runs once per MLXLM_RENDERER value, misses included"""
+        mock_find.return_value = None
+
+        with patch.dict(os.environ, {'MLXLM_RENDERER': ''}):
+            assert _detect_harmony_renderer() is None
+            assert _detect_harmony_renderer() is None
+        with patch.dict(os.environ, {'MLXLM_RENDERER': 'my.mod:render'}):
+            _detect_harmony_renderer()
+
+        assert [c.args for c in mock_find.call_args_list] == [('',), ('my.mod:render',)]
+
+
+# ===== Tests: Harmony streaming =====
+
+class TestHarmonyStreaming:
+    """Tests for extracting the Harmony final channel from a token stream"""
+
+    def test_stream_final_extracts_final_channel(self):
+        """Test that only final-channel text is yielded, up to the end marker"""
+        tokens = ["<|channel|>analysis<|message|>thinking<|end|>",
+                  "<|start|>assistant<|channel|>fi", "nal<|message|>Hello",
+                  " wor", "ld", "<|e", "nd|>ignored"]
+
+        result = "".join(_stream_final_from_harmony(iter(tokens)))
+
+        assert result == "Hello world"
+
+    def test_stream_final_stops_at_earliest_marker(self):
+        """Test that the earliest end marker ends the final channel, even in the marker's token"""
+        tokens = ["<|channel|>final<|message|>Answer<|start|>x<|end|>"]
+
+        result = "".join(_stream_final_from_harmony(iter(tokens)))
+
+        assert result == "Answer"
+
+    def test_strip_harmony_tags(self):
+        """Test tag stripping matches the <|...|> regex, including non-tags"""
+        assert _strip_harmony_tags("plain text") == "plain text"
+        assert _strip_harmony_tags("a<|channel|>b<|message|>c") == "abc"
+        assert _strip_harmony_tags("x <|a>b|> y") == "x <|a>b|> y"
+        assert _strip_harmony_tags("open <| only") == "open <| only"
+
+    def test_stream_final_char_by_char_long_reply(self):
+        """Test markers split across single-character tokens in a reply longer than the buffer"""
+        reply = "word " * 200
+        text = "<|channel|>analysis<|message|>x<|end|><|start|>assistant<|channel|>final<|message|>" + reply + "<|end|>tail"
+
+        result = "".join(_stream_final_from_harmony(iter(text)))
+
+        assert result == reply
+
 
 # ===== Tests: Helper utilities =====
 
@@ -244,6 +523,30 @@ class TestHelpers:
         assert _human_bytes(1024 * 1024 * 1024) == "1.00 GB"
         assert _human_bytes(5.5 * 1024 * 1024) == "5.50 MB"
 
+    def test_dir_size(self, tmp_path):
+        """Test directory size sums nested files without following symlinks"""
+        (tmp_path / "blobs").mkdir()
+        (tmp_path / "blobs" / "a").write_bytes(b"x" * 100)
+        (tmp_path / "b").write_bytes(b"y" * 20)
+        (tmp_path / "link").symlink_to(tmp_path / "blobs")
+
+        result = _dir_size(str(tmp_path))
+
+        assert result == 120 + (tmp_path / "link").lstat().st_size
+
+    def test_dir_usage_newest_mtime(self, tmp_path):
+        """Test directory usage reports the newest file mtime in the same walk"""
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "old").write_bytes(b"x" * 10)
+        (tmp_path / "sub" / "new").write_bytes(b"y" * 5)
+        os.utime(tmp_path / "old", (1000, 1000))
+        os.utime(tmp_path / "sub" / "new", (2000, 2000))
+
+        size, newest = _dir_usage(str(tmp_path))
+
+        assert size == 15
+        assert newest == 2000
+
     def test_count_tokens_with_encode(self):
         """Test token counting with encode method"""
         mock_tokenizer = MagicMock()
@@ -252,6 +555,19 @@ class TestHelpers:
         result = _count_tokens(mock_tokenizer, "Hello world")
         assert result == 5
 
+    def test_count_tokens_remembers_encode_path(self):
+        """Test the working encode() path is cached per tokenizer"""
+        class Encoding:
+            def __init__(self, n): self.ids = list(range(n))
+
+        mock_tokenizer = MagicMock()
+        mock_tokenizer.encode.side_effect = lambda text: Encoding(len(text.split()))
+
+        assert _count_tokens(mock_tokenizer, "a b c") == 3
+        assert _count_tokens(mock_tokenizer, "a b") == 2
+        assert _TOK_COUNTERS[mock_tokenizer] is _count_via_encode_ids
+        mock_tokenizer.assert_not_called()
+
     def test_count_tokens_fallback(self):
         """Test token counting fallback (char count / 4)"""
         mock_tokenizer = MagicMock()
@@ -286,11 +602,12 @@ class TestHelpers:
 
 """
 Test summary:
-- 3 alias loading tests
-- 7 name resolution tests
-- 2 config loading tests
-- 5 rendering tests
-- 5 helper utility tests
-
-Total: 22 unit tests for core.py
+- 8 alias loading tests
+- 9 name resolution tests
+- 6 config loading tests
+- 9 rendering tests
+- 4 Harmony streaming tests
+- 8 helper utility tests
+
+Total: 44 unit tests for core.py
 """